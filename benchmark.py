@@ -0,0 +1,272 @@
+#!/bin/python
+
+""" Benchmark suite for the landscape soils pipeline.  Synthetic landscape data files with realistic soil texture
+distributions are generated at a range of sizes, and each stage of the pipeline (csv parsing, database ingest, GROUP BY
+aggregation, texture decoding, in-memory aggregation, point cloud rendering and figure saving) is timed separately.
+The time taken to import each module in a fresh interpreter is also measured, and checked to not load matplotlib,
+which short-lived worker processes should only pay for when they draw.  Results are saved as JSON so that runs can be
+compared across versions, e.g.
+
+    python benchmark.py --sizes 1000 100000 --out after.json --compare before.json
+"""
+
+
+import argparse
+import csv
+import db_tools
+import json
+import landscape_cache
+import landscape_soils
+import numpy as np
+import os
+import platform
+import shutil
+import soil_plotter
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# default benchmark sizes, in rows of landscape data
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+
+# stages timed for each benchmark size, in pipeline order
+STAGES = ['csv_parse', 'csv_to_sql', 'list_to_sql', 'group_by', 'texture_decoding', 'memory_aggregate', 'render',
+          'savefig']
+
+# (sand, silt, clay) centers and relative frequencies of the soil populations that synthetic textures are drawn from,
+# loosely following the prevalence of loams, silt loams, sandy loams and clays in agricultural landscapes
+TEXTURE_CENTERS = [((40, 40, 20), 0.3), ((20, 65, 15), 0.25), ((65, 25, 10), 0.2), ((25, 30, 45), 0.15),
+                   ((88, 7, 5), 0.1)]
+
+# modules timed by the import benchmark, none of which should load matplotlib on import
+IMPORT_MODULES = ['profiling', 'db_tools', 'soil_collection', 'soil_classes', 'soil_store', 'landscape_cache',
+                  'soil_plotter', 'landscape_soils']
+
+
+def generate_landscape(landscape_fpath, rows, unique_soils=None, na_fraction=0.02, seed=0):
+    """ Write a synthetic .csv-format landscape data file with columns id, sand, silt, clay, area_ha_ and n_opt.  Soil
+    textures (in percent, to 0.1%) are drawn around the centers in TEXTURE_CENTERS, and rows are assigned to soils with
+    a skewed, Zipf-like frequency distribution, so a few soils cover much of the landscape.  A fraction na_fraction of
+    rows hold '#N/A' values.  By default there is one unique soil per 20 rows, up to 100,000
+    """
+    random = np.random.RandomState(seed)
+    if unique_soils is None:
+        unique_soils = int(min(max(rows // 20, 1), 100000))
+
+    # draw unique soil textures from a mixture of Dirichlet distributions around each center
+    centers, weights = zip(*TEXTURE_CENTERS)
+    populations = random.choice(len(centers), size=unique_soils, p=weights)
+    textures = np.array([random.dirichlet(np.asarray(centers[population]) / 4.0) for population in populations])
+    sand = np.round(textures[:, 0] * 100, 1)
+    clay = np.round(textures[:, 2] * 100, 1)
+    silt = np.round(np.clip(100 - sand - clay, 0, 100), 1)
+    fertilizer = np.round(np.clip(random.normal(30, 12, unique_soils), 0, 60), 1)
+
+    frequencies = 1.0 / np.arange(1, unique_soils + 1) ** 1.1
+    frequencies /= frequencies.sum()
+
+    with open(landscape_fpath, 'wb') as output_object:
+        writer = csv.writer(output_object)
+        writer.writerow(['id', 'sand', 'silt', 'clay', 'area_ha_', 'n_opt'])
+        block = 100000
+        for block_start in range(0, rows, block):
+            count = min(block, rows - block_start)
+            soils = random.choice(unique_soils, size=count, p=frequencies)
+            areas = np.round(random.lognormal(3, 1, count), 2)
+            missing = random.random_sample(count) < na_fraction
+            output_object.write(''.join(
+                '%i,#N/A,#N/A,#N/A,#N/A,#N/A\r\n' % (block_start + e) if missing[e] else
+                '%i,%.1f,%.1f,%.1f,%.2f,%.1f\r\n' % (block_start + e, sand[soil], silt[soil], clay[soil], areas[e],
+                                                      fertilizer[soil])
+                for e, soil in enumerate(soils)))
+    return landscape_fpath
+
+
+def time_stages(landscape_fpath, work_dir, stages=STAGES):
+    """ Time each of the named pipeline stages on a landscape data file, using work_dir for temporary databases and
+    figures.  Returns a dictionary of stage name: run time in seconds
+    """
+    columns = ['sand', 'silt', 'clay', 'area_ha_', 'n_opt']
+    timings = {}
+
+    def timed(stage, function, *args):
+        start = time.time()
+        result = function(*args)
+        timings[stage] = time.time() - start
+        return result
+
+    if 'csv_parse' in stages:
+        timed('csv_parse', landscape_cache.parse_columns, landscape_fpath, columns)
+
+    if 'csv_to_sql' in stages:
+        timed('csv_to_sql', db_tools.bulk_csv_to_sql, landscape_fpath, os.path.join(work_dir, 'bulk.db'), 'landscape')
+
+    # build, upload, aggregate and decode soil data following the original soils.db workflow
+    db_fpath = os.path.join(work_dir, 'soils.db')
+    if set(['list_to_sql', 'group_by', 'texture_decoding']) & set(stages):
+        start = time.time()
+        input_object = open(landscape_fpath, 'rU')
+        lines = csv.reader(input_object)
+        indices = landscape_soils.check_columns(lines.next(), columns)
+        soil_data = [['id', 'area', 'color_values'], ['TEXT', 'REAL', 'REAL']]
+        for line in lines:
+            if line[indices[0]] != '#N/A':
+                soil_data.append(['%.2f_%.2f_%.2f' % tuple(float(line[index])/100.0 for index in indices[:3]),
+                                  float(line[indices[3]])/100.0, float(line[indices[4]])])
+        input_object.close()
+        db_tools.list_to_sql(soil_data, db_fpath, 'soils')
+        timings['list_to_sql'] = time.time() - start
+        del soil_data
+
+        con = sqlite3.connect(db_fpath)
+        processed_data = timed('group_by', lambda: con.execute(
+            "SELECT id, SUM(area), AVG(color_values) FROM soils GROUP BY id").fetchall())
+        con.close()
+        timed('texture_decoding', lambda: [tuple(float(value) for value in row[0].split('_'))
+                                           for row in processed_data])
+
+    # aggregate in memory in file chunks in a single process, as soils_analysis() does by default, then render the
+    # results
+    input_object = db_tools.open_input(landscape_fpath)
+    indices = landscape_soils.check_columns(csv.reader(input_object).next(), columns)
+    soils = timed('memory_aggregate', landscape_soils._aggregate_input, landscape_fpath, input_object, indices, 1)[0]
+    input_object.close()
+
+    if 'render' in stages or 'savefig' in stages:
+        soils = soils.scaled(12000 / soils.size.sum())
+        start = time.time()
+        fig = soil_plotter.new_figure()
+        ax = fig.add_subplot(111)
+        soil_plotter.plot_triangle_axes(ax=ax)
+        soil_plotter.plot_triangle_grid(ax=ax)
+        soil_plotter.plot_simple_classes(ax=ax)
+        soil_plotter.soil_plotter(soils, custom_scalar_range=(0, 60), ax=ax)
+        timings['render'] = time.time() - start
+        timed('savefig', fig.savefig, os.path.join(work_dir, 'landscape.png'))
+
+    return dict((stage, timings[stage]) for stage in stages if stage in timings)
+
+
+def time_import(module, repeat=5):
+    """ Time importing a module in fresh Python interpreters, returning the fastest of repeat import times in seconds
+    and whether matplotlib was loaded by the import
+    """
+    code = "import sys, time; start = time.time(); import %s; print time.time() - start, 'matplotlib' in sys.modules" \
+        % module
+    times = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds, matplotlib_loaded = output.split()
+        times.append(float(seconds))
+    return min(times), matplotlib_loaded == 'True'
+
+
+def version():
+    """ Identify the version of the code being benchmarked by its git commit, if available
+    """
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=SIZES, stages=STAGES, work_dir=None, seed=0, imports=True):
+    """ Generate a synthetic landscape of each size and time each pipeline stage on it, after timing the import of each
+    module unless imports=False.  Returns a JSON-serializable dictionary describing the environment and listing the
+    results
+    """
+    import matplotlib
+
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='soil_benchmark_')
+    if not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    report = {'version': version(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__,
+              'sqlite': sqlite3.sqlite_version, 'results': [], 'imports': []}
+    if imports:
+        print "Benchmarking module imports..."
+        for module in IMPORT_MODULES:
+            seconds, matplotlib_loaded = time_import(module)
+            report['imports'].append({'module': module, 'seconds': seconds, 'matplotlib': matplotlib_loaded})
+            print "   %-18s %s%s" % (module, db_tools.human_time(seconds),
+                                     ' (loads matplotlib)' if matplotlib_loaded else '')
+        print
+
+    try:
+        for rows in sizes:
+            landscape_fpath = os.path.join(work_dir, 'landscape_%i.csv' % rows)
+            start = time.time()
+            generate_landscape(landscape_fpath, rows, seed=seed)
+            print "Benchmarking %i rows (generated in %s)..." % (rows, db_tools.human_time(time.time()-start))
+
+            size_dir = os.path.join(work_dir, 'run_%i' % rows)
+            os.makedirs(size_dir)
+            for stage, seconds in sorted(time_stages(landscape_fpath, size_dir, stages).items(),
+                                         key=lambda item: STAGES.index(item[0])):
+                report['results'].append({'rows': rows, 'stage': stage, 'seconds': seconds})
+                print "   %-18s %s" % (stage, db_tools.human_time(seconds))
+            print
+            shutil.rmtree(size_dir)
+            if not keep:
+                os.remove(landscape_fpath)
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def compare(baseline, current):
+    """ Print the ratio of current to baseline run time for each size and stage found in both benchmark reports
+    """
+    baseline_times = dict(((result['rows'], result['stage']), result['seconds']) for result in baseline['results'])
+    baseline_imports = dict((result['module'], result['seconds']) for result in baseline.get('imports', []))
+    print "Run time relative to baseline %s:" % baseline.get('version')
+    for result in current.get('imports', []):
+        if baseline_imports.get(result['module']) > 0:
+            print "   %-15s import  %6.2fx" % (result['module'], result['seconds'] / baseline_imports[result['module']])
+    for result in current['results']:
+        key = (result['rows'], result['stage'])
+        if key in baseline_times and baseline_times[key] > 0:
+            print "   %10i rows  %-18s %6.2fx" % (key[0], key[1], result['seconds'] / baseline_times[key])
+    print
+
+
+def main(argv=None):
+    """ Command-line entry point for running, saving and comparing benchmarks.  Returns 1 if any module loads
+    matplotlib on import, or 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the landscape soils pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="landscape sizes, in rows")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help="pipeline stages to time")
+    parser.add_argument('--out', default='benchmark.json', help="JSON file to save results to")
+    parser.add_argument('--compare', help="JSON file of baseline results to compare against")
+    parser.add_argument('--work-dir', help="directory to keep generated data in (default: temporary)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for synthetic data")
+    parser.add_argument('--no-imports', action='store_true', help="skip the module import benchmark")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.stages, args.work_dir, args.seed, imports=not args.no_imports)
+    with open(args.out, 'w') as output_object:
+        json.dump(report, output_object, indent=2, sort_keys=True)
+    print "Benchmark results saved to %s" % args.out
+    print
+
+    if args.compare:
+        with open(args.compare) as baseline_object:
+            compare(json.load(baseline_object), report)
+
+    # fail when a module starts loading matplotlib on import
+    eager = [result['module'] for result in report['imports'] if result['matplotlib']]
+    if eager:
+        print >> sys.stderr, "Module(s) %s load matplotlib on import" % ', '.join(eager)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
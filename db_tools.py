@@ -3,17 +3,57 @@
 """Collection of functions for creating or appending SQLite (sql) or postgreSQL (pg)
 databases with data from python lists or .csv tables.  All functions assume that data
 is structured with a two-line header, the first containing column names and the second
-data types, all in SQLite/postgreSQL-compatible format.  For particularly large files,
-there is an optional argument to specify the number of lines to read and upload in a
-single block, in order to limit the amount of data stored in memory and improve run
-times.
+data types, all in SQLite/postgreSQL-compatible format; the .csv loaders also accept
+files without a data type row, inferring types from a sample of the data.  For
+particularly large files, there is an optional argument to specify the number of lines
+to read and upload in a single block, in order to limit the amount of data stored in
+memory and improve run times.  Input files may be gzip, bz2 or xz-compressed, or read
+from stdin or a file-like object (see open_input()).
 """
 
 import sqlite3
+import bz2
 import csv
+import gzip
+from itertools import chain, islice
 from string import maketrans
+import sys
 import time
 import os
+import profiling
+import re
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+# PRAGMA settings trading durability for speed while a new database is bulk loaded
+BULK_LOAD_PRAGMAS = {'journal_mode': 'OFF', 'synchronous': 'OFF', 'cache_size': -262144}
+
+# SQLite data type names, and the SQLite equivalents of postgreSQL data type names
+SQLITE_TYPES = set(["TEXT", "REAL", "INT", "INTEGER", "NUMERIC", "BLOB"])
+PG_TYPES = {"varchar": "TEXT", "char": "TEXT", "bpchar": "TEXT", "character varying": "TEXT", "character": "TEXT",
+            "date": "TEXT", "time": "TEXT", "timestamp": "TEXT", "timestamptz": "TEXT", "timetz": "TEXT",
+            "interval": "TEXT", "json": "TEXT", "jsonb": "TEXT", "uuid": "TEXT", "float": "REAL", "float8": "REAL",
+            "float4": "REAL", "double precision": "REAL", "numeric": "REAL", "decimal": "REAL",
+            "int8": "INT", "int4": "INT", "int2": "INT", "bigint": "INT", "smallint": "INT", "serial": "INT",
+            "bigserial": "INT", "bool": "INT", "boolean": "INT", "bytea": "BLOB"}
+
+# values treated as missing when inferring column data types
+MISSING_VALUES = set(["", "#N/A", "NA", "NULL"])
+
+# leading bytes identifying each compressed input format, and the size of each read from input files
+COMPRESSION_MAGIC = [('gzip', '\x1f\x8b'), ('bz2', 'BZh'), ('xz', '\xfd7zXZ\x00')]
+INPUT_BUFFER_BYTES = 1024 * 1024
+
+# line endings recognized when reading lines from input streams, as for files opened in 'rU' mode
+LINE_END = re.compile('\r\n?|\n')
 
 
 def human_size(bytes):
@@ -54,21 +94,20 @@ def human_time(seconds):
 
 def sql_query_stats(cursor_object, query, db_fpath=''):
     """Structure to execute a query and return fetchall results, automatically printing out the execution time and
-    change in file size.
+    change in file size.  The query is also recorded as a profiling stage.
     """
 
     print "   Executing query:"
     print "   ", query
-    start_time = time.time()
-    if db_fpath:
-        initial_size = os.path.getsize(db_fpath)
-
-    cursor_object.execute(query)
-    results = cursor_object.fetchall()
-    print "    Query executed in %s" % human_time(time.time()-start_time)
+    with profiling.Stage('db_tools.sql_query', db_fpath=db_fpath, details={'query': query}) as stage:
+        cursor_object.execute(query)
+        results = cursor_object.fetchall()
+        stage.rows = len(results)
+    print "    Query executed in %s" % human_time(stage.wall_seconds)
 
     if db_fpath:
-        growth = os.path.getsize(db_fpath) - initial_size
+        initial_size = stage.initial_db_size
+        growth = stage.record['db_growth_bytes']
         print "    Database file %s increased in size from %s by %s (%.1f %%)" % \
               (db_fpath, human_size(initial_size), human_size(growth), (float(growth)/initial_size)*100)
 
@@ -76,6 +115,100 @@ def sql_query_stats(cursor_object, query, db_fpath=''):
     return results
 
 
+def table_commands(column_names, data_types, db_table):
+    """Define the SQLite command strings to create a new table with the specified column
+    names & data types, and to insert rows of tabular data into it.  Illegal characters
+    are removed from the column names.
+    Args-
+        column_names (list): column names, from the first header row
+        data_types (list): SQLite data types, from the second header row
+        db_table (str): name for new table
+    Returns-
+        tuple: (CREATE TABLE command, INSERT command)
+    """
+    # remove any illegal characters from column name
+    trantab = maketrans(",.()-/$", "_______")
+    entries = ["%s %s" % (name.translate(trantab), data_types[e]) for e, name in enumerate(column_names)]
+    create_table = "CREATE TABLE %s (%s)" % (db_table, ", ".join(entries))
+    insert_values = "INSERT INTO %s VALUES(%s)" % (db_table, ", ".join(["?"] * len(column_names)))
+    return create_table, insert_values
+
+
+def sqlite_type(type_name):
+    """Return the SQLite equivalent of a SQLite or postgreSQL data type name, ignoring case,
+    any length or precision and any trailing qualifiers, e.g. 'varchar(64)' -> 'TEXT' and
+    'timestamp without time zone' -> 'TEXT'.
+    Args-
+        type_name (str): data type name, as found in the second row of a csv header
+    Returns-
+        str: SQLite data type, or None if the name is not recognized
+    """
+    name = type_name.split("(")[0].strip()
+    if name.upper() in SQLITE_TYPES:
+        return name.upper()
+    return PG_TYPES.get(name.lower(), PG_TYPES.get(name.split(" ")[0].lower()))
+
+
+def infer_types(rows, column_count):
+    """Infer SQLite data types for the columns of a sample of csv rows:  INTEGER if every
+    non-missing value is an integer, REAL if every one is a number, and TEXT otherwise.
+    Args-
+        rows (list): sample of csv data rows
+        column_count (int): number of columns in the data
+    Returns-
+        list: SQLite data type of each column
+    """
+    types = []
+    for i in range(column_count):
+        column_type = "INTEGER"
+        for row in rows:
+            value = row[i].strip() if i < len(row) else ""
+            if value in MISSING_VALUES:
+                continue
+            try:
+                if column_type == "INTEGER":
+                    int(value)
+                else:
+                    float(value)
+            except ValueError:
+                try:
+                    float(value)
+                    column_type = "REAL"
+                except ValueError:
+                    column_type = "TEXT"
+                    break
+        types.append(column_type)
+    return types
+
+
+def read_csv_header(lines, sample_rows=1000):
+    """Read the header of a csv table from a csv reader, mapping postgreSQL data type names
+    in the second header row to SQLite on the fly.  The second row is taken as a data type
+    row if at least half of its entries are recognized type names; any other names in it
+    are passed through unchanged, as SQLite accepts arbitrary type names.  If there is no
+    data type row, types are inferred from the first sample_rows rows of data, which are
+    then passed on along with the rest of the data, so no extra pass through the file is
+    needed.
+    Args-
+        lines (iterator): csv reader positioned at the start of the table
+        sample_rows (int, optional): number of data rows to sample when inferring types
+    Returns-
+        tuple: (column names, SQLite data types, iterator over the data rows)
+    """
+    column_names = lines.next()
+    second_row = next(lines, None)
+    if second_row is None:
+        return column_names, ["TEXT"] * len(column_names), iter([])
+
+    data_types = [sqlite_type(value) for value in second_row]
+    recognized = len([data_type for data_type in data_types if data_type])
+    if len(second_row) == len(column_names) and recognized and recognized * 2 >= len(data_types):
+        return column_names, [data_type or value.strip() for data_type, value in zip(data_types, second_row)], lines
+
+    sample = [second_row] + list(islice(lines, sample_rows-1))
+    return column_names, infer_types(sample, len(column_names)), chain(sample, lines)
+
+
 def list_to_sql(data, db_fpath, db_table):
     """Copy contents of a python list into a table in an existing or new SQLite database
     file.  Assumes list has a standard two-row header:  column names, SQLite data types.
@@ -89,23 +222,9 @@ def list_to_sql(data, db_fpath, db_table):
     # clone input list into this function's stack frame so original is not changed
     my_list = data[:]
 
-    # remove any illegal characters from column name
-    trantab = maketrans(",.()-/$", "_______")
-    for i in range(len(my_list[0])):
-        my_list[0][i] = my_list[0][i].translate(trantab)
-
-    # define SQLite command string to create new table with required columns names & data types
-    entries = ""
-    count = 0
-    for e in range(len(my_list[0])):
-        entries += "%s %s, " % (my_list[0][e], my_list[1][e])
-        count +=1
-    create_table = "CREATE TABLE %s (%s)" % (db_table, entries[:-2])
-    
-    # define SQLite command string for tabular data insertion
-    values = count*"?, "
-    insert_values = "INSERT INTO %s VALUES(%s)" % (db_table, values[:-2])
-     
+    # define SQLite command strings to create new table and insert tabular data
+    create_table, insert_values = table_commands(my_list[0], my_list[1], db_table)
+
     # delete two header rows of list
     for i in range(2):
         del my_list[0]
@@ -142,12 +261,177 @@ def append_sql(data, db_fpath, db_table):
         cur.executemany(insert_values, my_list)
 
 
+class _Passthrough(object):
+    """Stand-in decompressor for uncompressed streams.
+    """
+    unused_data = ''
+
+    def decompress(self, data):
+        return data
+
+
+def _decompressor(compression):
+    """Create a new incremental decompressor for a compression format named in
+    COMPRESSION_MAGIC, or a pass-through for None.
+    """
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        if lzma is None:
+            raise IOError("Reading xz-compressed input requires the lzma module (backports.lzma on Python 2)")
+        return lzma.LZMADecompressor()
+    return _Passthrough()
+
+
+class InputStream(object):
+    """Read-only, line-iterable file object that streams data from a raw binary file
+    object in large blocks, decompressing it on the fly.  Concatenated compressed
+    streams (e.g. appended gzip members) are read in turn.  readline() and iteration end
+    each line with '\n', whether it ended with '\n', '\r\n' or '\r' (as in 'rU' mode), so
+    data with Windows or classic Mac line endings reads the same as it does uncompressed.
+    read() returns the data untranslated, and tell() counts untranslated bytes, so
+    offsets match those in the uncompressed file.
+    """
+    def __init__(self, raw, compression=None, buffer_size=INPUT_BUFFER_BYTES, head='', close_raw=True):
+        self.raw = raw
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.close_raw = close_raw
+        self._decompressor = _decompressor(compression)
+        self._buffer = self._decompress(head)
+        self._position = 0
+        self._offset = 0
+        self._eof = False
+
+    def _decompress(self, data):
+        output = []
+        while data:
+            try:
+                output.append(self._decompressor.decompress(data))
+            except EOFError:
+                # the previous stream has ended, so the data starts a new one
+                self._decompressor = _decompressor(self.compression)
+                continue
+            data = getattr(self._decompressor, 'unused_data', '')
+            if data:
+                self._decompressor = _decompressor(self.compression)
+        return ''.join(output)
+
+    def _fill(self):
+        """Decompress blocks of input into the buffer until it grows or the input ends,
+        returning False at the end of the input.
+        """
+        while not self._eof:
+            data = self.raw.read(self.buffer_size)
+            if not data:
+                self._eof = True
+                return False
+            output = self._decompress(data)
+            if output:
+                self._buffer = self._buffer[self._position:] + output
+                self._offset += self._position
+                self._position = 0
+                return True
+        return False
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) - self._position < size) and self._fill():
+            pass
+        end = len(self._buffer) if size < 0 else self._position + size
+        data = self._buffer[self._position:end]
+        self._position += len(data)
+        return data
+
+    def readline(self):
+        searched = 0
+        while True:
+            match = LINE_END.search(self._buffer, self._position + searched)
+            if match is not None and (match.group() != '\r' or match.end() < len(self._buffer)):
+                break
+            # read on, re-checking a '\r' at the end of the buffer, which may begin a '\r\n'
+            searched = (len(self._buffer) if match is None else match.start()) - self._position
+            if not self._fill():
+                break
+        if match is None:
+            line = self._buffer[self._position:]
+            self._position = len(self._buffer)
+            return line
+        line = self._buffer[self._position:match.start()] + '\n'
+        self._position = match.end()
+        return line
+
+    def tell(self):
+        return self._offset + self._position
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        if self.close_raw:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+        return False
+
+
+def detect_compression(head):
+    """Identify the compression format of data from its leading bytes.
+    Args-
+        head (str): first few bytes of the data
+    Returns-
+        str: 'gzip', 'bz2' or 'xz', or None for uncompressed data
+    """
+    for compression, magic in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_input(source, buffer_size=INPUT_BUFFER_BYTES):
+    """Open a .csv or other text input for reading lines, transparently decompressing
+    gzip, bz2 or xz-compressed data (detected from its leading bytes, not its file
+    name) as it is read in large blocks.  Uncompressed files are opened directly.
+    Args-
+        source (str or file): file path, '-' for stdin, or a binary file-like object
+        buffer_size (int, optional): number of bytes to read from the source at a time
+    Returns-
+        file: line-iterable file object, to be closed by the caller (stdin and file-like
+            sources are left open)
+    """
+    if isinstance(source, basestring) and source != '-':
+        with open(source, 'rb') as input_object:
+            head = input_object.read(6)
+        compression = detect_compression(head)
+        if compression is None:
+            return open(source, 'rU', buffer_size)
+        _decompressor(compression)  # fail before opening the file if the format is unsupported
+        return InputStream(open(source, 'rb'), compression, buffer_size)
+
+    raw = sys.stdin if source == '-' else source
+    head = raw.read(6)
+    return InputStream(raw, detect_compression(head), buffer_size, head=head, close_raw=False)
+
+
 def csv_to_sql(csv_fpath, db_fpath, db_table, delim="c", line_block=0):
     """Copy contents of a .csv file into a table in an existing or new SQLite database
-    file.  Assumes list has a standard two-row header:  column names, SQLite data types.
-    Function will fail if file/table already exists.
+    file.  Assumes a header row of column names, optionally followed by a row of SQLite
+    or postgreSQL data types (see read_csv_header()).  Function will fail if file/table
+    already exists.
     Args-
-        csv_fpath (str): full path from root of csv file to upload
+        csv_fpath (str or file): full path from root of csv file to upload, which may be
+            compressed, or '-' for stdin or a file-like object (see open_input())
         db_fpath (str): full path from root of database file to create
         delim (str, optional): 'c'=comma (default) or 't'=tab
         line_block (int, optional): number of lines to read as a block (default is
@@ -157,103 +441,196 @@ def csv_to_sql(csv_fpath, db_fpath, db_table, delim="c", line_block=0):
     print "Copying %s to SQLite database %s..." % (csv_fpath, db_fpath)
     start = time.time()
 
-    # copy .csv contents into a python list
+    # read the header, then copy .csv contents into a python list
+    input_object = open_input(csv_fpath)
     if delim == "t":
-        lines = csv.reader(open(csv_fpath, 'rU'), delimiter="\t")
+        lines = csv.reader(input_object, delimiter="\t")
     else:
-        lines = csv.reader(open(csv_fpath, 'rU'))
-        
-    # upload data in either a single or multiple blocks
-    my_list = [[]]
-    line_total = 0
-    if line_block == 0:
-        for line in lines:
-            my_list.append(line)
-            line_total += 1
-        del my_list[0]
-        list_to_sql(my_list, db_fpath, db_table)
-    else:
-        # create new database table from headers and first row of data
-        for i in range(3):
-            line = lines.next()
-            my_list.append(line)
-            line_total += 1
-        del my_list[0]
-        list_to_sql(my_list, db_fpath, db_table)
+        lines = csv.reader(input_object)
+    column_names, data_types, rows = read_csv_header(lines)
 
-        # fill a list of data with the appropriate block size, and append to previously-created database
-        data = [[]]
-        bail = 0
-        line_count = 1
-        while True:
-            while line_count <= line_block:
-                try:
-                    line = lines.next()
-                    data.append(line)
-                    line_count += 1
-                    line_total += 1
-                except:
-                    bail = 1
-                    break
-            del data[0]
+    # upload data in either a single or multiple blocks
+    with profiling.Stage('db_tools.csv_to_sql', db_fpath=db_fpath, details={'csv_fpath': csv_fpath}) as stage:
+        line_total = 0
+        if line_block == 0:
+            my_list = [column_names, data_types]
+            for line in rows:
+                my_list.append(line)
+                line_total += 1
+            list_to_sql(my_list, db_fpath, db_table)
+        else:
+            # create new database table from headers, then fill a list of data with the appropriate block size and
+            # append it to the previously-created database
+            list_to_sql([column_names, data_types], db_fpath, db_table)
+            data = []
+            for line in rows:
+                data.append(line)
+                line_total += 1
+                if len(data) == line_block:
+                    append_sql(data, db_fpath, db_table)
+                    data = []
             if data:
                 append_sql(data, db_fpath, db_table)
-            data = [[]]
-            line_count = 0
-            if bail == 1:
-                break
+        stage.rows = line_total
+    input_object.close()
 
     # stop timer and report time elapsed
     print "    Total of %i data rows (%i columns each) uploaded in %s s" % \
-          (line_total-2, len(my_list[0]), round(time.time()-start, 6))
+          (line_total, len(column_names), round(time.time()-start, 6))
     print
 
 
-def query_to_csv(cursor_object, table, query, out_fpath, types=True):
+def bulk_csv_to_sql(csv_fpath, db_fpath, db_table, delim="c", pragmas=None, indexes=()):
+    """Copy contents of a .csv file into a table in an existing or new SQLite database
+    file using a single connection and transaction.  Rows are streamed from the csv
+    reader directly into executemany() without being collected into lists, and any
+    secondary indexes are built after the load.  Assumes a header row of column names,
+    optionally followed by a row of SQLite or postgreSQL data types (see
+    read_csv_header()).  Function will fail if table already exists.
+    Args-
+        csv_fpath (str or file): full path from root of csv file to upload, which may be
+            compressed, or '-' for stdin or a file-like object (see open_input())
+        db_fpath (str): full path from root of database file to create
+        db_table (str): name for new table
+        delim (str, optional): 'c'=comma (default) or 't'=tab
+        pragmas (dict, optional): PRAGMA settings to apply for the load, e.g.
+            BULK_LOAD_PRAGMAS
+        indexes (list, optional): column names, or tuples of column names, to index
+            once all rows are loaded
+    Returns-
+        int: number of data rows uploaded
+    """
+    # print operation description and start timer
+    print "Bulk loading %s to SQLite database %s..." % (csv_fpath, db_fpath)
+    start = time.time()
+
+    input_object = open_input(csv_fpath)
+    if delim == "t":
+        lines = csv.reader(input_object, delimiter="\t")
+    else:
+        lines = csv.reader(input_object)
+    column_names, data_types, rows = read_csv_header(lines)
+    create_table, insert_values = table_commands(column_names, data_types, db_table)
+
+    # manage the transaction explicitly, so PRAGMAs apply outside of it and everything else happens within it
+    con = sqlite3.connect(db_fpath, isolation_level=None)
+    cur = con.cursor()
+    in_transaction = False
+    try:
+        with profiling.Stage('db_tools.bulk_csv_to_sql', db_fpath=db_fpath, details={'csv_fpath': csv_fpath}) as stage:
+            for pragma, value in sorted((pragmas or {}).items()):
+                cur.execute("PRAGMA %s = %s" % (pragma, value))
+
+            cur.execute("BEGIN")
+            in_transaction = True
+            cur.execute(create_table)
+            cur.executemany(insert_values, rows)
+            row_total = stage.rows = cur.rowcount
+            load_time = time.time()-start
+
+            for index_columns in indexes:
+                if isinstance(index_columns, basestring):
+                    index_columns = (index_columns,)
+                index_name = "idx_%s_%s" % (db_table, "_".join(index_columns))
+                cur.execute("CREATE INDEX %s ON %s (%s)" % (index_name, db_table, ", ".join(index_columns)))
+            cur.execute("COMMIT")
+    except Exception:
+        # failures before BEGIN, e.g. a bad PRAGMA, leave no transaction to roll back
+        if in_transaction:
+            cur.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+        input_object.close()
+
+    # stop timer and report time elapsed and load rate
+    elapsed = time.time()-start
+    print "    Total of %i data rows (%i columns each) uploaded in %s (%i rows/s), %s including indexing" % \
+          (row_total, len(column_names), human_time(load_time), row_total/max(load_time, 1e-6), human_time(elapsed))
+    print
+    return row_total
+
+
+def result_types(rows, column_count):
+    """Infer SQLite data types for the columns of a batch of query results from the first
+    non-null value in each column, defaulting to TEXT.
+    Args-
+        rows (list): rows of query results
+        column_count (int): number of columns in the results
+    Returns-
+        list: SQLite data type of each column
+    """
+    types = ["TEXT"] * column_count
+    for i in range(column_count):
+        for row in rows:
+            if row[i] is not None:
+                if isinstance(row[i], (int, long)):
+                    types[i] = "INTEGER"
+                elif isinstance(row[i], float):
+                    types[i] = "REAL"
+                elif isinstance(row[i], buffer):
+                    types[i] = "BLOB"
+                break
+    return types
+
+
+def query_to_csv(cursor_object, table, query, out_fpath, types=True, batch_size=10000, compress=False):
     """Saves a standard-format csv table (including a two-line header of column names
-    and data types) for the specified 'SELECT *'-type query statement.
-        Note: to return a more restricted list of data columns, first save them as a
-        new table or view and then execute this function.
+    and data types) for any SELECT query statement.  Results are streamed from the
+    cursor in batches, so memory use stays constant however large the result is.  Column
+    names are taken from the cursor description; SQLite does not report the types of
+    query results, so data types are inferred from the first batch of rows.
     Args-
         cursor_object (object): previously-defined SQLite cursor object name
-        table (str): table to be queries
-        query (str): SQLite-formatted 'SELECT *'-type query
-        out_fpath (str): full file path for output
+        table (str): not used; retained for compatibility with earlier versions
+        query (str): SQLite-formatted SELECT query
+        out_fpath (str): full file path for output, gzip-compressed if it ends in '.gz'
+        types (bool, optional): include the row of data types in the header (default)
+        batch_size (int, optional): number of rows to fetch from the cursor at a time
+        compress (bool, optional): gzip-compress the output whatever its file name
+    Returns-
+        int: number of data rows written
     """
     cursor_object.execute(query)
-    rows = cursor_object.fetchall()
-    cursor_object.execute("PRAGMA table_info(%s)" % table)
-    columns = cursor_object.fetchall()
-    labels = []
-    types = []
-    for i in range(len(columns)):
-        labels.append(columns[i][1])
-        types.append(columns[i][2])
-    rows.insert(0, labels)
-    if types:
-        rows.insert(1, types)
-    c = csv.writer(open(out_fpath, "wb"))
-    for row in rows:
-        c.writerow(row)
+    labels = [column[0] for column in cursor_object.description]
+    rows = cursor_object.fetchmany(batch_size)
+
+    if compress or out_fpath.endswith('.gz'):
+        out_file = gzip.open(out_fpath, "wb")
+    else:
+        out_file = open(out_fpath, "wb")
+    row_total = 0
+    with out_file:
+        c = csv.writer(out_file)
+        c.writerow(labels)
+        if types:
+            c.writerow(result_types(rows, len(labels)))
+        while rows:
+            c.writerows(rows)
+            row_total += len(rows)
+            rows = cursor_object.fetchmany(batch_size)
+    return row_total
 
 
 def pg_to_sql(csv_fpath, delim="c"):
     """Function to convert postgreSQL-format data types in .csv headers to SQLite format.
+    Only the data type row is changed.  Note that csv_to_sql() and bulk_csv_to_sql() map
+    postgreSQL data types as they load, so this full-file rewrite is no longer needed
+    before loading.
     Args-
         csv_fpath (str): file path of .csv file to be converted
     """
     temp_csv_fpath = csv_fpath+".temp"
     if delim == "t":
         in_file = csv.reader(open(csv_fpath, 'rU'), delimiter="\t")
+        out_file = csv.writer(open(temp_csv_fpath, "w"), delimiter="\t")
     else:
         in_file = csv.reader(open(csv_fpath, 'rU'))
-    out_file = csv.writer(open(temp_csv_fpath, "w"))
-    replacements = {"varchar":"TEXT", "float8":"REAL", "float4":"REAL", "int4":"INT", "int2":"INT"}
+        out_file = csv.writer(open(temp_csv_fpath, "w"))
 
-    for line in in_file:
-        for i in range(len(line)):
-            for src, target in replacements.iteritems():
-                line[i] = line[i].replace(src, target)
+    for e, line in enumerate(in_file):
+        if e == 1:
+            line = [sqlite_type(value) or value for value in line]
         out_file.writerow(line)
     os.remove(csv_fpath)
     os.rename(temp_csv_fpath, csv_fpath)
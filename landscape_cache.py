@@ -0,0 +1,109 @@
+#!/bin/python
+
+""" Binary columnar cache of .csv-format landscape data files.  The first time a set of columns is requested from a file
+it is parsed as text, and the selected columns are saved as NumPy .npy arrays alongside a record of the source file's
+modification time and size.  Later requests memory-map the saved arrays instead of re-parsing the file, until the
+source file changes.  Missing values are held as NaN, so each analysis can leave out just the rows missing the values
+it uses (see complete_rows()).
+"""
+
+
+from array import array
+import csv
+import db_tools
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+
+
+# value marking missing data in landscape data files; rows missing any value an analysis uses are left out of it
+MISSING_VALUE = '#N/A'
+
+# version of the cache entry layout, recorded in each entry's manifest; entries in other layouts are rebuilt
+CACHE_FORMAT = 2
+
+
+def cache_path(landscape_fpath, columns, cache_dir):
+    """ Return the cache directory used for the selected columns of a landscape data file
+    """
+    identity = '\0'.join([os.path.abspath(landscape_fpath)] + list(columns))
+    return os.path.join(cache_dir, hashlib.sha1(identity).hexdigest()[:20])
+
+
+def source_stamp(landscape_fpath):
+    """ Return the modification time and size used to detect changes to a landscape data file
+    """
+    stat = os.stat(landscape_fpath)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def parse_columns(landscape_fpath, columns):
+    """ Parse the selected columns of a .csv-format landscape data file (which may be compressed, or '-' for stdin; see
+    db_tools.open_input()) into a list of float arrays, with NaN for missing values
+    """
+    input_object = db_tools.open_input(landscape_fpath)
+    lines = csv.reader(input_object)
+    column_names = lines.next()
+    indices = [column_names.index(column) for column in columns]
+
+    # accumulate values in compact typed arrays rather than lists of float objects
+    values = [array('d') for column in columns]
+    nan = float('nan')
+    for line in lines:
+        for e, index in enumerate(indices):
+            field = line[index]
+            values[e].append(nan if field == MISSING_VALUE else float(field))
+    input_object.close()
+    return [np.frombuffer(column_values, dtype=np.float64) for column_values in values]
+
+
+def complete_rows(*columns):
+    """ Return a boolean mask of the rows with no missing (NaN) value in any of the given column arrays
+    """
+    complete = np.ones(len(columns[0]), dtype=bool)
+    for column in columns:
+        complete &= ~np.isnan(column)
+    return complete
+
+
+def load_columns(landscape_fpath, columns, cache_dir='.landscape_cache'):
+    """ Return a list of read-only float arrays holding the selected columns of a .csv-format landscape data file (with
+    NaN for missing values), memory-mapped from the cache when it is up to date with the source file, and otherwise
+    parsed and saved to the cache
+    """
+    columns = list(columns)
+    directory = cache_path(landscape_fpath, columns, cache_dir)
+    manifest_fpath = os.path.join(directory, 'source.json')
+    stamp = source_stamp(landscape_fpath)
+
+    if os.path.exists(manifest_fpath):
+        with open(manifest_fpath) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('format') == CACHE_FORMAT and manifest['mtime'] == stamp['mtime'] and \
+                manifest['size'] == stamp['size']:
+            return [np.load(os.path.join(directory, '%i.npy' % e), mmap_mode='r') for e in range(len(columns))]
+
+    # parse the source file, and write a complete new cache entry before swapping it in place of any stale one
+    print "Caching columns %s of %s..." % (', '.join(columns), landscape_fpath)
+    arrays = parse_columns(landscape_fpath, columns)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    temp_directory = '%s.%i.tmp' % (directory, os.getpid())
+    os.makedirs(temp_directory)
+    for e, column_array in enumerate(arrays):
+        np.save(os.path.join(temp_directory, '%i.npy' % e), column_array)
+    manifest = dict(stamp, format=CACHE_FORMAT, path=os.path.abspath(landscape_fpath), columns=columns,
+                    rows=len(arrays[0]))
+    with open(os.path.join(temp_directory, 'source.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    if os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.rename(temp_directory, directory)
+    except OSError:
+        # another process wrote the same cache entry first
+        shutil.rmtree(temp_directory, ignore_errors=True)
+    return [np.load(os.path.join(directory, '%i.npy' % e), mmap_mode='r') for e in range(len(columns))]
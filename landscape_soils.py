@@ -4,28 +4,371 @@
 distributions.
 """
 
+import argparse
 import csv
-from db_tools import list_to_sql
-import matplotlib.pyplot as plt
+from db_tools import human_size, human_time, InputStream, open_input
+import json
+from itertools import islice
+from math import floor
+import landscape_cache
+from multiprocessing import cpu_count, current_process, Pool
 import numpy as np
-from operator import itemgetter
+import os
+import profiling
+import soil_classes
+from soil_collection import SoilCollection, texture_keys
 import soil_plotter
-import sqlite3
+import soil_store
+import sys
+import time
+import traceback
+
+
+# approximate size of the byte ranges landscape data files are split into for parallel aggregation
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# ways soils_analysis() can aggregate soil data
+AGGREGATIONS = ('memory', 'parallel', 'sql')
+
+# matplotlib movie writers that soils_sweep() can save animations with, in order of preference, by file extension
+MOVIE_WRITERS = {'.gif': ['pillow', 'imagemagick'], '.mp4': ['ffmpeg', 'avconv']}
+
+
+def check_columns(column_names, columns):
+    """ Return the index of each of the required columns in a list of column names, raising a ValueError that lists
+    every required column missing from the data
+    """
+    missing = [column for column in columns if column not in column_names]
+    if missing:
+        raise ValueError("Column(s) %s not found; available columns are %s" %
+                         (', '.join("'%s'" % column for column in missing),
+                          ', '.join("'%s'" % name for name in column_names)))
+    return [column_names.index(column) for column in columns]
+
+
+def _soil_totals(lines, sand_index, silt_index, clay_index, size_index, color_index):
+    """ Accumulate [total area, sum of area*color, row count, sum of color] for each unique soil texture in rows of soil
+    data, keyed on whole-percent sand, silt and clay content (rounding halves up), skipping rows missing any of the
+    values (see landscape_cache.MISSING_VALUE).  Returns the dictionary of totals and the number of rows read
+    """
+    missing = landscape_cache.MISSING_VALUE
+    soils = {}
+    row_count = 0
+    for row_count, line in enumerate(lines, 1):
+        if missing not in (line[sand_index], line[silt_index], line[clay_index], line[size_index],
+                           line[color_index]):
+            key = (int(floor(float(line[sand_index]) + 0.5)),
+                   int(floor(float(line[silt_index]) + 0.5)),
+                   int(floor(float(line[clay_index]) + 0.5)))
+            size = float(line[size_index])/100.0
+            color = float(line[color_index])
+
+            totals = soils.get(key)
+            if totals is None:
+                soils[key] = [size, size*color, 1, color]
+            else:
+                totals[0] += size
+                totals[1] += size*color
+                totals[2] += 1
+                totals[3] += color
+    return soils, row_count
+
+
+def _totals_collection(soils):
+    """ Convert a dictionary of soil totals from _soil_totals() to a SoilCollection sorted by area (largest first)
+    """
+    # sorted by size, so smallest points can be printed on top of larger ones
+    keys = sorted(soils)
+    totals = np.array([soils[key] for key in keys], dtype=float).reshape(-1, 4)
+    percents = np.array(keys, dtype=float).reshape(-1, 3)
+    return SoilCollection.from_totals(texture_keys(percents[:, 0], percents[:, 1], percents[:, 2]), totals[:, 0],
+                                      totals[:, 1], totals[:, 3], totals[:, 2])
+
+
+@profiling.profiled()
+def aggregate_soils(lines, sand_index, silt_index, clay_index, size_index, color_index):
+    """ Stream rows of soil data once, grouping them in memory on soil texture quantized to 1% resolution.  Returns a
+    SoilCollection of the total area and area-weighted mean color value of each unique soil, sorted by area (largest
+    first)
+    """
+    soils, row_count = _soil_totals(lines, sand_index, silt_index, clay_index, size_index, color_index)
+    profiling.current_stage().rows = row_count
+    return _totals_collection(soils)
+
+
+def chunk_ranges(landscape_fpath, chunk_bytes=CHUNK_BYTES):
+    """ Split the data rows of a .csv-format landscape data file (everything after the header line) into (start, end)
+    byte ranges of about chunk_bytes each, with every range ending at a line boundary ('\n', '\r\n' or '\r', as in
+    'rU' mode).  The ranges depend only on the file and chunk_bytes
+    """
+    file_size = os.path.getsize(landscape_fpath)
+    ranges = []
+    with open(landscape_fpath, 'rb') as input_object:
+        lines = InputStream(input_object, close_raw=False)
+        lines.readline()
+        start = lines.tell()
+        while start < file_size:
+            input_object.seek(start + chunk_bytes - 1)
+            lines = InputStream(input_object, close_raw=False)
+            lines.readline()
+            end = min(start + chunk_bytes - 1 + lines.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _aggregate_chunk(chunk):
+    """ Parse and pre-aggregate one byte range of a landscape data file, given as a tuple of (file path, start, end,
+    column indices), returning _soil_totals() results
+    """
+    landscape_fpath, start, end, indices = chunk
+    with open(landscape_fpath, 'rb') as input_object:
+        input_object.seek(start)
+        data = input_object.read(end - start)
+    return _soil_totals(csv.reader(data.splitlines()), *indices)
+
+
+def _aggregate_block(block):
+    """ Parse and pre-aggregate one block of lines of landscape data, given as a tuple of (text, column indices),
+    returning _soil_totals() results
+    """
+    data, indices = block
+    return _soil_totals(csv.reader(data.splitlines()), *indices)
+
+
+def _text_blocks(input_object, chunk_bytes=CHUNK_BYTES):
+    """ Read blocks of about chunk_bytes of whole lines from a (possibly decompressing) file object, split at the same
+    points as chunk_ranges() would split the uncompressed file
+    """
+    while True:
+        block = input_object.read(chunk_bytes - 1)
+        if not block:
+            return
+        yield block + input_object.readline()
+
+
+def _merge_totals(partials):
+    """ Merge a sequence of _soil_totals() results, in order, into one dictionary of totals and a total row count
+    """
+    soils = {}
+    row_count = 0
+    for partial_soils, partial_row_count in partials:
+        row_count += partial_row_count
+        for key, partial_totals in partial_soils.iteritems():
+            totals = soils.get(key)
+            if totals is None:
+                soils[key] = partial_totals
+            else:
+                for i in range(4):
+                    totals[i] += partial_totals[i]
+    return soils, row_count
+
+
+@profiling.profiled()
+def aggregate_soils_parallel(landscape_fpath, columns, processes=None, chunk_bytes=CHUNK_BYTES):
+    """ Group the soil data in a .csv-format landscape data file on soil texture quantized to 1% resolution, as
+    aggregate_soils() does, with the file split into line-aligned byte ranges of about chunk_bytes that are parsed and
+    pre-aggregated in parallel across a pool of worker processes (one per CPU by default).  Partial totals are merged
+    in file order, so results are identical for any number of processes, including the single process soils_analysis()
+    uses for in-memory aggregation.  Compressed files and streams (see db_tools.open_input()) are decompressed in this
+    process and split into the same chunks, which are handed to the workers.  Data rows must not contain quoted line
+    breaks.  Returns a SoilCollection sorted by area (largest first)
+    """
+    input_object = open_input(landscape_fpath)
+    indices = check_columns(csv.reader([input_object.readline()]).next(), columns)
+    soils, row_count = _aggregate_input(landscape_fpath, input_object, indices, processes, chunk_bytes)
+    profiling.current_stage().rows = row_count
+    return soils
+
+
+def _aggregate_input(landscape_fpath, input_object, indices, processes=None, chunk_bytes=CHUNK_BYTES):
+    """ Aggregate the data rows of a landscape data file opened with open_input() and read past its header line, as
+    aggregate_soils_parallel() does, given the indices of its sand, silt, clay, size and color columns.  Returns the
+    SoilCollection and the number of data rows read
+    """
+    if isinstance(input_object, file):
+        # workers read byte ranges of uncompressed files for themselves
+        input_object.close()
+        chunks = ((landscape_fpath, start, end, indices) for start, end in chunk_ranges(landscape_fpath, chunk_bytes))
+        worker = _aggregate_chunk
+    else:
+        chunks = ((block, indices) for block in _text_blocks(input_object, chunk_bytes))
+        worker = _aggregate_block
+    print "Determining total point size and associated area-weighted color for each unique soil in the dataset, " \
+          "in chunks of %s..." % human_size(chunk_bytes)
+
+    # batch worker processes cannot start pools of their own, so they parse their chunks in turn
+    if processes != 1 and not current_process().daemon:
+        pool = Pool(processes)
+        try:
+            # hand out a few chunks per worker at a time, so decompressed data is not all queued in memory at once
+            window = 2 * (processes or cpu_count())
+            batches = iter(lambda: list(islice(chunks, window)), [])
+            soils, row_count = _merge_totals(partial for batch in batches for partial in pool.imap(worker, batch))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        soils, row_count = _merge_totals(worker(chunk) for chunk in chunks)
+    input_object.close()
+    return _totals_collection(soils), row_count
+
+
+@profiling.profiled()
+def aggregate_soil_arrays(sand, silt, clay, size, color):
+    """ Group arrays of soil data (sand, silt and clay content in percent, plus size and color values) on soil texture
+    quantized to 1% resolution, with the same results as aggregate_soils(), leaving out rows with any missing (NaN)
+    value.  Returns a SoilCollection of the total area and area-weighted mean color value of each unique soil, sorted
+    by area (largest first)
+    """
+    soils = SoilCollection(sand, silt, clay, np.asarray(size, dtype=float) / 100.0, color)
+    complete = landscape_cache.complete_rows(soils.sand, soils.silt, soils.clay, soils.size, soils.color)
+    if not complete.all():
+        soils = soils[complete]
+    profiling.current_stage().rows = len(soils)
+    return soils.aggregate()
+
+
+@profiling.profiled()
+def aggregate_soils_sql(landscape_fpath, columns, db_fpath='soils.db', scenario=None):
+    """ Load the selected sand, silt, clay, size and color columns of a landscape data file into a persistent soil store
+    (see soil_store) as a scenario, unless the store already holds the current version of the file, and read back the
+    total area and area-weighted color value of each unique soil from its indexed summary table.  The scenario is named
+    after the file and columns unless a name is given.  Sizes are scaled row by row, as aggregate_soils() does, before
+    they are totalled.  Returns a SoilCollection sorted by area (largest first)
+    """
+    scenario = scenario or soil_store.scenario_name(landscape_fpath, columns)
+    store = soil_store.SoilStore(db_fpath)
+    try:
+        if store.is_current(scenario, landscape_fpath):
+            print "Reading soil data for scenario %s from database %s..." % (scenario, db_fpath)
+        else:
+            print "Reading soil data data into database to facilitate analysis & sorting..."
+            data = landscape_cache.parse_columns(landscape_fpath, columns)
+            sand, silt, clay, size, color = [column[landscape_cache.complete_rows(*data)] for column in data]
+            # another process sharing the store may have loaded the file meanwhile, in which case it is kept as it is
+            rows = store.replace(scenario, sand, silt, clay, size / 100.0, color, source_fpath=landscape_fpath,
+                                 unless_current=True)
+            profiling.current_stage().rows = rows
+        soils = store.soils(scenario)
+    finally:
+        store.close()
+    return soils
+
+
+@profiling.profiled()
+def aggregate_soil_metrics(sand, silt, clay, sizes, colors):
+    """ Group arrays of soil data on soil texture quantized to 1% resolution, as aggregate_soil_arrays() does, for
+    several metrics at once: each pair of size and color arrays in the sequences sizes and colors is totalled over the
+    same grouping of soils, computed only once.  Rows with a missing (NaN) texture are left out of every metric, and
+    rows missing a size or color value only out of that metric, so each result matches a separate
+    aggregate_soil_arrays() call.  Returns a list of SoilCollections, one per metric, each sorted by area (largest
+    first)
+    """
+    sand, silt, clay = [np.asarray(column, dtype=float) for column in (sand, silt, clay)]
+    textured = landscape_cache.complete_rows(sand, silt, clay)
+    sand, silt, clay = sand[textured], silt[textured], clay[textured]
+    groups = np.unique(texture_keys(sand, silt, clay), return_inverse=True)
+    profiling.current_stage().rows = len(groups[1])
+
+    metrics = []
+    for size, color in zip(sizes, colors):
+        soils = SoilCollection(sand, silt, clay, np.asarray(size, dtype=float)[textured] / 100.0,
+                               np.asarray(color, dtype=float)[textured])
+        complete = landscape_cache.complete_rows(soils.size, soils.color)
+        # rows missing this metric's values need a grouping of their own
+        metrics.append(soils.aggregate(groups) if complete.all() else soils[complete].aggregate())
+    return metrics
+
+
+def _plot_scaled(soils):
+    """ Normalize & scale the sizes of a SoilCollection to a total point area of 12000 for plotting, raising a
+    ValueError if no soil data rows with any area were aggregated
+    """
+    total = soils.size.sum()
+    if not total > 0:
+        raise ValueError("No soil data to plot: %i soils aggregated, with a total size of %g" % (len(soils), total))
+    return soils.scaled(12000 / total)
+
+
+def _plot_soils(ax, soils, title='', legend_title='', scalar_range=(0, 60), cached_background=False, density_bins=0):
+    """ Plot a SoilCollection on a soil texture triangle in the given axes, with a color scale legend and title.
+    Returns the soil points (or density map) collection and the title text
+    """
+    soils = _plot_scaled(soils)
+
+    if cached_background:
+        soil_plotter.plot_triangle_background('simple', ax=ax)
+    else:
+        soil_plotter.plot_triangle_axes(ax=ax)
+        soil_plotter.plot_triangle_grid(ax=ax)
+        soil_plotter.plot_simple_classes(ax=ax)
+        # soil_plotter.plot_usda_classes(ax=ax)
+    if density_bins:
+        soil_artist = soil_plotter.soil_density_plotter(soils, bins=density_bins, custom_scalar_range=scalar_range,
+                                                        ax=ax)
+    else:
+        soil_artist = soil_plotter.soil_plotter(soils, custom_scalar_range=scalar_range, ax=ax)
+
+    # create legend
+    custom_scale = list(np.linspace(scalar_range[0], scalar_range[1], 5))
+    scale_colors = soil_plotter.color_scale_array(soil_plotter.c2, soil_plotter.c2_light, custom_scale,
+                                                  (min(custom_scale), max(custom_scale)))
+    for i, entry in enumerate(custom_scale):
+        ax.plot([0, 0], [0, 0], color=scale_colors[i], label=str(custom_scale[i]), linewidth=12)
+    l = ax.legend(bbox_to_anchor=(1.13, 1.1), title=legend_title, prop={'size': 14})
+    l.get_title().set_multialignment('center')
+
+    # add title
+    title_text = ax.text(-0.5, 1.2, title, ha='center', va='center', fontsize=15)
+    return soil_artist, title_text
+
+
+def _soils_figure(soils, title='', legend_title='', scalar_range=(0, 60), cached_background=False, density_bins=0):
+    """ Plot a SoilCollection on a soil texture triangle in a new figure of its own, as for _plot_soils().  Returns the
+    figure, its axes, the soil points (or density map) collection and the title text
+    """
+    fig = soil_plotter.new_figure()
+    ax = fig.add_subplot(111)
+    soil_artist, title_text = _plot_soils(ax, soils, title, legend_title, scalar_range, cached_background,
+                                          density_bins)
+    return fig, ax, soil_artist, title_text
 
 
 def soils_analysis(landscape_fpath, sand_column, silt_column, clay_column, size_column, color_column, figure_name,
-                   title='', legend_title=''):
+                   title='', legend_title='', aggregation='memory', scalar_range=(0, 60), verify=True,
+                   cached_background=False, density_bins=0, cache_dir=None, db_fpath='soils.db', scenario=None,
+                   processes=None, timings=None):
+    """ Plot the distribution of soils in a .csv-format landscape data file on a soil texture triangle.  By default the
+    file is streamed once and aggregated in memory (aggregation='memory'); aggregation='sql' instead keeps the soil data
+    as a scenario (named after the file and columns unless a scenario name is given) in the persistent soil store at
+    db_fpath, so re-plotting an unchanged file skips reading it; and aggregation='parallel' parses and aggregates chunks
+    of the file across the given number of worker processes (one per CPU by default).  Point colors span scalar_range,
+    and with verify=False the data columns are not confirmed interactively before the analysis runs.  With
+    cached_background=True the triangle axes, grid and classes are drawn from a raster rendered once per process, which
+    speeds up rendering many figures.  Setting density_bins draws soils as a density map of density_bins**2 triangular
+    cells rather than as individual points, which suits landscapes with very many unique soils.  If a cache_dir is
+    given, the data columns are read from a binary cache of the landscape file kept in that directory (see
+    landscape_cache), which is only rebuilt when the file changes.  If a timings dictionary is given, the run time in
+    seconds of each stage of the analysis is recorded in it, in addition to the full metrics recorded through the
+    profiling module.  The landscape file may be gzip, bz2 or xz-compressed, and may be given as '-' to stream it from
+    stdin, or as an open file object, with the default aggregation (see db_tools.open_input())
+    """
+    if timings is None:
+        timings = {}
+    if aggregation not in AGGREGATIONS:
+        raise ValueError("Unknown aggregation '%s'; choose one of %s" % (aggregation, ', '.join(AGGREGATIONS)))
+    streamed = not isinstance(landscape_fpath, basestring) or landscape_fpath == '-'
+    if streamed and (cache_dir or aggregation != 'memory'):
+        raise ValueError("Landscape data streamed from stdin or a file object can only be aggregated in memory")
 
     # open .csv-format landscape data file and verify data columns
-    input_object = open(landscape_fpath, 'rU')
+    input_object = open_input(landscape_fpath)
     lines = csv.reader(input_object)
     column_names = lines.next()
 
-    sand_index = column_names.index(sand_column)
-    silt_index = column_names.index(silt_column)
-    clay_index = column_names.index(clay_column)
-    size_index = column_names.index(size_column)
-    color_index = column_names.index(color_column)
+    sand_index, silt_index, clay_index, size_index, color_index = \
+        check_columns(column_names, [sand_column, silt_column, clay_column, size_column, color_column])
 
     print
     print "Please verify:"
@@ -36,80 +379,326 @@ def soils_analysis(landscape_fpath, sand_column, silt_column, clay_column, size_
     print "   Point color data being extracted from column %i, '%s'" % (color_index, color_column)
     print
 
-    raw_input("Press ENTER to continue:")
+    if verify:
+        raw_input("Press ENTER to continue:")
+        print
+
+    # aggregate total point size and associated area-weighted color for each unique soil in the dataset
+    with profiling.Stage('landscape_soils.aggregate', details={'landscape_fpath': str(landscape_fpath)}) as stage:
+        if cache_dir:
+            print "Determining total point size and associated area-weighted color for each unique soil in the " \
+                  "dataset..."
+            columns = landscape_cache.load_columns(landscape_fpath, [sand_column, silt_column, clay_column,
+                                                                     size_column, color_column], cache_dir)
+            soils = aggregate_soil_arrays(*columns)
+        elif aggregation == 'parallel':
+            columns = [sand_column, silt_column, clay_column, size_column, color_column]
+            soils = aggregate_soils_parallel(landscape_fpath, columns, processes)
+        elif aggregation == 'sql':
+            columns = [sand_column, silt_column, clay_column, size_column, color_column]
+            soils = aggregate_soils_sql(landscape_fpath, columns, db_fpath, scenario)
+        else:
+            # aggregate in the same chunks as aggregation='parallel', so both give identical results
+            soils = _aggregate_input(landscape_fpath, input_object,
+                                     [sand_index, silt_index, clay_index, size_index, color_index], processes=1)[0]
+        input_object.close()
+        stage.rows = len(soils)
+    timings['aggregate'] = stage.wall_seconds
+
+    with profiling.Stage('landscape_soils.plot', rows=len(soils)) as stage:
+        fig = _soils_figure(soils, title, legend_title, scalar_range, cached_background, density_bins)[0]
+    timings['plot'] = stage.wall_seconds
+
+    # save
+    with profiling.Stage('landscape_soils.save', details={'figure_name': figure_name}) as stage:
+        fig.savefig(figure_name)
+    timings['save'] = stage.wall_seconds
     print
 
-    # read each line of soil data into an intermediary data structure, using surface texture as an identifier
-    print "Reading soil data data into database to facilitate analysis & sorting..."
-    soil_data = [['id', 'area', 'color_values'], ['TEXT', 'REAL', 'REAL']]
 
-    for e, line in enumerate(lines):
+def soils_sweep(landscape_fpath, sand_column, silt_column, clay_column, size_column, color_columns, output, titles=None,
+                legend_title='', scalar_range=(0, 60), cached_background=True, cache_dir=None, fps=2):
+    """ Plot the same landscape under a series of scenarios, one frame per color column in color_columns (e.g. optimal
+    fertilizer rates under different carbon prices), titled with the matching entry of titles (by default the column
+    names).  The data file is read once, and the figure, its background and the soil point collection are drawn once;
+    each frame then only updates the positions, sizes and colors of the existing points and the title.  Frames are
+    saved as an animated GIF or MP4 file if output ends in .gif or .mp4, using a locally installed matplotlib movie
+    writer (pillow or ImageMagick for GIFs, ffmpeg or avconv for MP4s), or otherwise as an image sequence named by
+    formatting output with each frame number, e.g. 'sweep_%02i.png'.  Rows missing a color value are left out of that
+    scenario's frame only.  Returns the list of files written
+    """
+    color_columns = list(color_columns)
+    titles = list(titles) if titles else color_columns
+    extension = os.path.splitext(output)[1].lower()
+    if extension in MOVIE_WRITERS:
+        from matplotlib import animation
+        available = [name for name in MOVIE_WRITERS[extension] if animation.writers.is_available(name)]
+        if not available:
+            raise RuntimeError("No matplotlib movie writer for %s files is available (tried %s); save an image "
+                               "sequence instead" % (extension, ', '.join(MOVIE_WRITERS[extension])))
+        writer = animation.writers[available[0]](fps=fps)
+    elif '%' not in output:
+        raise ValueError("Image sequence output name '%s' needs a frame number format, e.g. 'sweep_%%02i.png'" %
+                         output)
 
-        # determine soil texture
-        sand_string = line[sand_index]
-        if sand_string != '#N/A':
-            sand = float(line[sand_index])/100.0
-            silt = float(line[silt_index])/100.0
-            clay = float(line[clay_index])/100.0
-            size = float(line[size_index])/100.0
-            color = float(line[color_index])
+    # read the texture and size columns and every color column in a single pass
+    print "Reading %i scenarios from %s..." % (len(color_columns), landscape_fpath)
+    columns = [sand_column, silt_column, clay_column, size_column] + color_columns
+    if cache_dir:
+        data = landscape_cache.load_columns(landscape_fpath, columns, cache_dir)
+    else:
+        data = landscape_cache.parse_columns(landscape_fpath, columns)
+    scenarios = aggregate_soil_metrics(data[0], data[1], data[2], [data[3]] * len(color_columns), data[4:])
 
-            # convert soil texture to string, and save to intermediate data list
-            id = '%.2f_%.2f_%.2f' % (sand, silt, clay)
-            soil_data.append([id, size, color])
-
-    # upload soil data to database
-    db_fpath = 'soils.db'
-    list_to_sql(soil_data, db_fpath, 'soils')
-
-    # extract list of unique soils, and associated total size and average color data values
-    print "Determining total point size and associated area-weighted color for each unique soil in the dataset..."
-    con = sqlite3.connect(db_fpath)
-    with con:
-        cur = con.cursor()
-        cur.execute("SELECT id, SUM(area), AVG(color_values) FROM soils GROUP BY id")
-        processed_data = cur.fetchall()
-
-    # sort by size (so smallest points can be printed on top of larger ones) and extract soil texture data
-    processed_data.sort(key=itemgetter(1), reverse=True)
-
-    soil_strings, sizes, color_scalars = zip(*processed_data)
-    textures = []
-    for soil_string in soil_strings:
-        texture = soil_string.split('_')
-        for i in range(len(texture)):
-            texture[i] = float(texture[i])
-        textures.append(tuple(texture))
-
-    # normalize & scale areas
-    scalar = 12000
-    areas = np.asarray(sizes)
-    total_area = np.sum(areas)
-    areas /= total_area
-    areas *= scalar
-
-    # create soil texture triangle plot
-    soil_plotter.plot_triangle_axes()
-    soil_plotter.plot_triangle_grid()
-    soil_plotter.plot_simple_classes()
-    # soil_plotter.plot_usda_classes()
-    soil_plotter.soil_plotter(textures, areas, color_scalars, custom_scalar_range=(0, 60))
+    # build the figure once, then update its points for each frame
+    fig, ax, points, title_text = _soils_figure(scenarios[0], titles[0], legend_title, scalar_range, cached_background)
 
-    # create legend
-    custom_scale = [0.0, 15.0, 30.0, 45.0, 60.0]
-    scale_colors = [soil_plotter.color_scale(soil_plotter.c2, soil_plotter.c2_light, X, (min(custom_scale), max(custom_scale))) for X in custom_scale]
-    for i, entry in enumerate(custom_scale):
-        plt.plot([0, 0], [0, 0], color=scale_colors[i], label=str(custom_scale[i]), linewidth=12)
-    l = plt.legend(bbox_to_anchor=(1.13, 1.1), title=legend_title, prop={'size': 14})
-    plt.setp(l.get_title(), multialignment='center')
-
-    # add title and save
-    plt.text(-0.5, 1.2, title, ha='center', va='center', fontsize=15)
-    plt.savefig(figure_name)
-    plt.close()
+    def update(e):
+        with profiling.Stage('landscape_soils.sweep_frame', rows=len(scenarios[e]), details={'frame': e}):
+            soils = _plot_scaled(scenarios[e])
+            soil_plotter.update_soil_points(points, soils, custom_scalar_range=scalar_range)
+            title_text.set_text(titles[e])
+
+    if extension in MOVIE_WRITERS:
+        with writer.saving(fig, output, fig.dpi):
+            for e in range(len(scenarios)):
+                update(e)
+                writer.grab_frame()
+        written = [output]
+    else:
+        written = []
+        for e in range(len(scenarios)):
+            update(e)
+            fig.savefig(output % e)
+            written.append(output % e)
+    print "    %i frames saved to %s" % (len(scenarios), output)
+    print
+    return written
+
+
+def soils_small_multiples(landscape_fpath, sand_column, silt_column, clay_column, size_column, color_columns,
+                          figure_name, titles=None, legend_title='', scalar_range=(0, 60), cached_background=True,
+                          cache_dir=None, panels_per_row=3, timings=None):
+    """ Plot several metrics from one landscape data file as a grid of soil texture triangles in a single figure, one
+    panel per color column in color_columns, titled with the matching entry of titles (by default the column names).
+    size_column may be a single column shared by every panel or a list with one size column per panel, and likewise
+    legend_title may be a list of legend titles and scalar_range a list of (low, high) color ranges.  The file is read
+    once (or from the binary cache in cache_dir) and every metric is aggregated over a single grouping of soils.
+    Panels share one cached background raster unless cached_background=False.  If a timings dictionary is given, the
+    run time in seconds of each stage is recorded in it
+    """
+    if timings is None:
+        timings = {}
+    color_columns = list(color_columns)
+    panels = len(color_columns)
+    size_columns = [size_column] * panels if isinstance(size_column, basestring) else list(size_column)
+    titles = list(titles) if titles else color_columns
+    legend_titles = [legend_title] * panels if isinstance(legend_title, basestring) else list(legend_title)
+    scalar_ranges = [scalar_range] * panels if np.ndim(scalar_range) == 1 else list(scalar_range)
+    if not len(size_columns) == len(titles) == len(legend_titles) == len(scalar_ranges) == panels:
+        raise ValueError("Size columns, titles, legend titles and scalar ranges must be given once or once per color "
+                         "column")
+
+    # read each distinct column once, and aggregate every metric in the same pass over the data
+    with profiling.Stage('landscape_soils.aggregate', details={'landscape_fpath': str(landscape_fpath)}) as stage:
+        columns = [sand_column, silt_column, clay_column]
+        for column in size_columns + color_columns:
+            if column not in columns:
+                columns.append(column)
+        print "Determining total point size and associated area-weighted color for each unique soil and each of %i " \
+              "metrics in %s..." % (panels, landscape_fpath)
+        if cache_dir:
+            data = dict(zip(columns, landscape_cache.load_columns(landscape_fpath, columns, cache_dir)))
+        else:
+            data = dict(zip(columns, landscape_cache.parse_columns(landscape_fpath, columns)))
+        metrics = aggregate_soil_metrics(data[sand_column], data[silt_column], data[clay_column],
+                                         [data[column] for column in size_columns],
+                                         [data[column] for column in color_columns])
+        stage.rows = len(metrics[0])
+    timings['aggregate'] = stage.wall_seconds
+
+    # tile one panel per metric, each laid out exactly as in a figure of its own
+    with profiling.Stage('landscape_soils.plot', rows=stage.rows * panels) as stage:
+        columns_count = min(panels, panels_per_row)
+        rows_count = -(-panels // columns_count)
+        width, height = soil_plotter.new_figure().get_size_inches()
+        fig = soil_plotter.new_figure(figsize=(width * columns_count, height * rows_count))
+        margins = fig.subplotpars
+        for e, soils in enumerate(metrics):
+            row, column = divmod(e, columns_count)
+            ax = fig.add_axes([(column + margins.left) / columns_count,
+                               (rows_count - 1 - row + margins.bottom) / rows_count,
+                               (margins.right - margins.left) / columns_count,
+                               (margins.top - margins.bottom) / rows_count], label='panel %i' % e)
+            _plot_soils(ax, soils, titles[e], legend_titles[e], scalar_ranges[e], cached_background)
+    timings['plot'] = stage.wall_seconds
+
+    with profiling.Stage('landscape_soils.save', details={'figure_name': figure_name}) as stage:
+        fig.savefig(figure_name)
+    timings['save'] = stage.wall_seconds
     print
 
 
-soils_analysis('landscape_iii.csv', 'sand', 'silt', 'clay', 'area_ha_', 'n_opt', 'landscape_iii.png',
-               title="205 USD (Mg $\mathregular{CO_{2}}$eq$\mathregular{)^{-1}}$",
-               legend_title="Optimal fertilizer\napplication rate\n(kg N $\mathregular{ha^{-1}}$)")
\ No newline at end of file
+def summarize_soil_classes(landscape_fpath, sand_column, silt_column, clay_column, size_column, system='usda'):
+    """ Total the area of each soil texture class ('usda' or 'simple' system) in a .csv-format landscape data file,
+    without plotting.  The file may be compressed or streamed, as for soils_analysis().  Returns a dictionary of class
+    name: total area
+    """
+    # aggregate area by unique soil (the size column stands in for the unused color values), then by texture class,
+    # restoring the original units of the size column
+    soils = aggregate_soils_parallel(landscape_fpath, [sand_column, silt_column, clay_column, size_column, size_column],
+                                     processes=1)
+    areas = soil_classes.class_areas(soils.textures, soils.size*100.0, system)
+
+    print "Total %s by %s soil texture class in %s:" % (size_column, system.upper(), landscape_fpath)
+    for name in sorted(areas, key=areas.get, reverse=True):
+        print "   %-16s %14.2f" % (name, areas[name])
+    print
+    return areas
+
+
+def _run_batch_job(job):
+    """ Run soils_analysis() for a single batch job specification, or soils_small_multiples() for a job with a list of
+    color_columns, capturing its run time, profiling records and any error raised
+    """
+    start = time.time()
+    timings = {}
+    with profiling.collect() as profiler:
+        try:
+            if 'color_columns' in job:
+                soils_small_multiples(timings=timings, **job)
+            else:
+                soils_analysis(verify=False, timings=timings, **job)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+    return {'figure_name': job.get('figure_name'), 'seconds': time.time()-start, 'timings': timings,
+            'profile': profiler.records, 'error': error}
+
+
+def batch_soils_analysis(jobs, processes=None):
+    """ Render many landscape figures in parallel across a pool of worker processes.  Each job is a dictionary of
+    soils_analysis() arguments, e.g. {'landscape_fpath': 'landscape_iii.csv', 'sand_column': 'sand', ...,
+    'figure_name': 'landscape_iii.png', 'title': '...', 'legend_title': '...', 'scalar_range': (0, 60)}, or of
+    soils_small_multiples() arguments for jobs with a list of 'color_columns'.  Returns one result per job, in order,
+    recording the figure name, run time in seconds, per-stage timings, profiling records and error traceback (None on
+    success)
+    """
+    print "Rendering %i landscape figures..." % len(jobs)
+    start = time.time()
+    pool = Pool(processes)
+    try:
+        results = pool.map(_run_batch_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    failures = [result for result in results if result['error']]
+    for result in failures:
+        print "   Failed to render %s:" % result['figure_name']
+        print result['error']
+    print "    %i of %i figures rendered in %s" % \
+          (len(results)-len(failures), len(results), human_time(time.time()-start))
+    print
+    return results
+
+
+def load_jobs(config_fpath):
+    """ Read soils_analysis() job specifications from a JSON config file, which may hold a single job, a list of jobs,
+    or an object with a list of "jobs" and a dictionary of "defaults" shared by every job
+    """
+    with open(config_fpath) as config_file:
+        config = json.load(config_file)
+    if isinstance(config, dict) and 'jobs' in config:
+        defaults = config.get('defaults', {})
+        jobs = [dict(defaults, **job) for job in config['jobs']]
+    elif isinstance(config, dict):
+        jobs = [config]
+    else:
+        jobs = config
+    return [dict((str(key), value) for key, value in job.items()) for job in jobs]
+
+
+def check_job(job):
+    """ Verify that a job's landscape data file can be read and holds all of the required data columns, returning a
+    description of the problem, or None if there is none
+    """
+    color_key = 'color_columns' if 'color_columns' in job else 'color_column'
+    required = ['landscape_fpath', 'sand_column', 'silt_column', 'clay_column', 'size_column', color_key,
+                'figure_name']
+    missing = [key for key in required if key not in job]
+    if missing:
+        return "missing job setting(s) %s" % ', '.join(missing)
+    if job.get('aggregation', 'memory') not in AGGREGATIONS:
+        return "unknown aggregation '%s'; choose one of %s" % (job['aggregation'], ', '.join(AGGREGATIONS))
+    columns = [job['sand_column'], job['silt_column'], job['clay_column']]
+    for key in ('size_column', color_key):
+        columns += [job[key]] if isinstance(job[key], basestring) else list(job[key])
+    if job['landscape_fpath'] == '-':
+        # stdin can only be read once, by the job itself
+        return None
+    try:
+        with open_input(job['landscape_fpath']) as input_object:
+            column_names = csv.reader(input_object).next()
+        check_columns(column_names, columns)
+    except StopIteration:
+        return "%s: empty file" % job['landscape_fpath']
+    except (IOError, ValueError) as e:
+        return "%s: %s" % (job['landscape_fpath'], e)
+    return None
+
+
+def main(argv=None):
+    """ Command-line entry point: run every soils_analysis() (or soils_small_multiples()) job in a JSON config file
+    without prompting, in parallel when there are several.  Returns 0 on success, 1 if any job failed, or 2 if the
+    config is invalid
+    """
+    parser = argparse.ArgumentParser(description="Plot landscape soil distributions on soil texture triangles")
+    parser.add_argument('config', help="JSON file of soils_analysis() job settings")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="number of worker processes for multiple jobs (default: one per CPU)")
+    parser.add_argument('--profile', action='store_true', help="print run times for each stage of each job")
+    parser.add_argument('--profile-json', help="save detailed profiling records for every job to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.config)
+    except (IOError, ValueError) as e:
+        print >> sys.stderr, "Could not read config %s: %s" % (args.config, e)
+        return 2
+    problems = [(job.get('figure_name'), check_job(job)) for job in jobs]
+    problems = [(figure_name, problem) for figure_name, problem in problems if problem]
+    for figure_name, problem in problems:
+        print >> sys.stderr, "Invalid job %s: %s" % (figure_name, problem)
+    if problems:
+        return 2
+
+    if len(jobs) > 1 and args.processes != 1:
+        results = batch_soils_analysis(jobs, args.processes)
+    else:
+        results = [_run_batch_job(job) for job in jobs]
+        for result in results:
+            if result['error']:
+                print >> sys.stderr, result['error']
+
+    if args.profile:
+        print "Stage timings:"
+        for result in results:
+            stages = ', '.join("%s %s" % (stage, human_time(result['timings'][stage]))
+                               for stage in ('aggregate', 'plot', 'save') if stage in result['timings'])
+            print "   %s: %s total (%s)" % (result['figure_name'], human_time(result['seconds']), stages)
+        print
+
+    if args.profile_json:
+        records = [dict(record, figure_name=result['figure_name'])
+                   for result in results for record in result['profile']]
+        with open(args.profile_json, 'w') as json_file:
+            json.dump(records, json_file, indent=2, sort_keys=True)
+
+    if any(result['error'] for result in results):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,13 @@
 #!/bin/python
 
-""" Control script- modules are imported and executed here.
+""" Control script- modules are imported and executed here.  Runs the soils_analysis() jobs defined in a JSON config
+file, e.g. 'python master.py landscape_iii.json --profile'; see landscape_soils.main() for options.
 """
 
 
-import soil_plotter
+import landscape_soils
+import sys
 
 
-soil_plotter.test('test.png')
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(landscape_soils.main())
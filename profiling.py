@@ -0,0 +1,196 @@
+#!/bin/python
+
+""" Timing and metrics for stages of the landscape soils pipeline.  Any block of code can be wrapped as a stage with the
+Stage context manager, or any function with the profiled() decorator, to record its wall time, CPU time, memory use,
+row count and database file growth.  Each record is logged as a line of JSON through the 'profiling' logger, and is
+only kept where a Profiler is collecting records, so that a run's records can be saved together, e.g.
+
+    with profiling.collect() as profiler:
+        with profiling.Stage('aggregate', db_fpath='soils.db') as stage:
+            ...
+            stage.rows = len(rows)
+    profiler.write_json('profile.json')
+"""
+
+
+from contextlib import contextmanager
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+logger = logging.getLogger('profiling')
+logger.addHandler(logging.NullHandler())
+
+# stages currently running in each thread, innermost last, and the profiler collecting each thread's records, if any
+_active = threading.local()
+
+
+def peak_rss():
+    """ Return the peak resident set size of this process so far, in bytes, or None where it is not available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    """ Return the current resident set size of this process in bytes, or None where it is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def cpu_time():
+    """ Return the user plus system CPU time used by this process so far, in seconds
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+class Profiler(object):
+    """ Collects the records of completed stages
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self._lock:
+            del self.records[:]
+
+    def write_json(self, json_fpath):
+        """ Save all stage records to a JSON file
+        """
+        with open(json_fpath, 'w') as json_file:
+            json.dump(self.records, json_file, indent=2, sort_keys=True)
+
+
+@contextmanager
+def collect(profiler=None):
+    """ Collect the records of every stage completed in this thread within the block in a Profiler (a new one unless
+    one is given), which the block receives.  Records are not kept outside of such blocks
+    """
+    profiler = profiler or Profiler()
+    previous = getattr(_active, 'profiler', None)
+    _active.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active.profiler = previous
+
+
+class Stage(object):
+    """ Context manager recording metrics for a stage of the pipeline.  Set the rows attribute within the stage to
+    record the number of rows it processed; give a db_fpath to record how much a database file grows; set
+    trace_memory=True to record the peak memory allocated by Python during the stage where tracemalloc is available;
+    and give a dictionary of details, e.g. a query, to include them in the record.  The record is added to the given
+    profiler, or else to the one collecting records in this thread (see collect()), if any
+    """
+    def __init__(self, name, rows=None, db_fpath=None, trace_memory=False, details=None, profiler=None):
+        self.name = name
+        self.rows = rows
+        self.details = details
+        self.db_fpath = db_fpath
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self.profiler = profiler
+        self.record = None
+
+    def __enter__(self):
+        stack = getattr(_active, 'stack', None)
+        if stack is None:
+            stack = _active.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+
+        self.initial_db_size = self._db_size()
+        self.initial_peak_rss = peak_rss()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        else:
+            self.started_tracing = False
+        self.start_cpu = cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        wall_seconds = time.time() - self.start
+        cpu_seconds = cpu_time() - self.start_cpu
+        _active.stack.remove(self)
+
+        self.record = {'stage': self.name, 'parent': self.parent, 'wall_seconds': wall_seconds,
+                       'cpu_seconds': cpu_seconds, 'rows': self.rows, 'rss_bytes': current_rss(),
+                       'peak_rss_bytes': peak_rss(), 'error': exc_type.__name__ if exc_type else None}
+        if self.initial_peak_rss is not None:
+            self.record['peak_rss_growth_bytes'] = self.record['peak_rss_bytes'] - self.initial_peak_rss
+        if self.details:
+            self.record.update(self.details)
+        if self.rows and wall_seconds > 0:
+            self.record['rows_per_second'] = self.rows / wall_seconds
+        if self.db_fpath:
+            self.record['db_fpath'] = self.db_fpath
+            self.record['db_growth_bytes'] = self._db_size() - self.initial_db_size
+        if self.trace_memory:
+            self.record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+
+        profiler = self.profiler or getattr(_active, 'profiler', None)
+        if profiler is not None:
+            profiler.add(self.record)
+        logger.info(json.dumps(self.record, sort_keys=True))
+        return False
+
+    @property
+    def wall_seconds(self):
+        return self.record['wall_seconds'] if self.record else time.time() - self.start
+
+    def _db_size(self):
+        if self.db_fpath and os.path.exists(self.db_fpath):
+            return os.path.getsize(self.db_fpath)
+        return 0
+
+
+def current_stage():
+    """ Return the innermost stage running in this thread, or None
+    """
+    stack = getattr(_active, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def profiled(name=None, **stage_kwargs):
+    """ Decorator recording each call of a function as a Stage, named after the function unless a name is given
+    """
+    def decorator(function):
+        stage_name = name or '%s.%s' % (function.__module__, function.__name__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Stage(stage_name, **stage_kwargs):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,158 @@
+#!/bin/python
+
+""" Routines to classify soil textures, defined as arrays of (sand fraction, silt fraction, clay fraction), into the 12
+standard USDA soil texture classes or the four simplified texture groupings drawn by soil_plotter, and to total soil
+areas by class.  Classification uses lookup tables precomputed at 1% texture resolution, so arrays of millions of
+textures can be classified without any per-soil Python code.
+"""
+
+
+import numpy as np
+
+
+# class names, in the order of the integer class indices returned by the classification functions
+USDA_CLASSES = ('sand', 'loamy sand', 'sandy loam', 'loam', 'silt loam', 'silt', 'sandy clay loam', 'clay loam',
+                'silty clay loam', 'sandy clay', 'silty clay', 'clay')
+SIMPLE_CLASSES = ('sandy', 'loamy', 'clayey', 'silty')
+
+
+def usda_rules(sand, silt, clay):
+    """ Assign USDA texture class indices to arrays of sand, silt and clay content in percent, using the standard
+    USDA class definitions.  Returns -1 for any texture not covered by a class
+    """
+    sand = np.asarray(sand, dtype=float)
+    silt = np.asarray(silt, dtype=float)
+    clay = np.asarray(clay, dtype=float)
+    indices = np.full(np.broadcast(sand, silt, clay).shape, -1, dtype=np.int8)
+
+    rules = [
+        ('sand', (silt + 1.5*clay < 15)),
+        ('loamy sand', (silt + 1.5*clay >= 15) & (silt + 2*clay < 30)),
+        ('sandy loam', (((clay >= 7) & (clay < 20) & (sand > 52)) | ((clay < 7) & (silt < 50))) &
+                       (silt + 2*clay >= 30)),
+        ('loam', (clay >= 7) & (clay < 27) & (silt >= 28) & (silt < 50) & (sand <= 52)),
+        ('silt loam', ((silt >= 50) & (clay >= 12) & (clay < 27)) | ((silt >= 50) & (silt < 80) & (clay < 12))),
+        ('silt', (silt >= 80) & (clay < 12)),
+        ('sandy clay loam', (clay >= 20) & (clay < 35) & (silt < 28) & (sand > 45)),
+        ('clay loam', (clay >= 27) & (clay < 40) & (sand > 20) & (sand <= 45)),
+        ('silty clay loam', (clay >= 27) & (clay < 40) & (sand <= 20)),
+        ('sandy clay', (clay >= 35) & (sand > 45)),
+        ('silty clay', (clay >= 40) & (silt >= 40)),
+        ('clay', (clay >= 40) & (sand <= 45) & (silt < 40)),
+    ]
+    for name, mask in rules:
+        indices[mask & (indices < 0)] = USDA_CLASSES.index(name)
+    return indices
+
+
+def simple_rules(sand, silt, clay):
+    """ Assign simplified texture class indices to arrays of sand, silt and clay content in percent, matching the
+    boundaries drawn by soil_plotter.plot_simple_classes(): > 65% sand is 'sandy', > 65% silt is 'silty', > 35% clay
+    is 'clayey', and anything else, including textures exactly on a boundary, is 'loamy'
+    """
+    sand = np.asarray(sand, dtype=float)
+    silt = np.asarray(silt, dtype=float)
+    clay = np.asarray(clay, dtype=float)
+    indices = np.full(np.broadcast(sand, silt, clay).shape, SIMPLE_CLASSES.index('loamy'), dtype=np.int8)
+    indices[sand > 65] = SIMPLE_CLASSES.index('sandy')
+    indices[silt > 65] = SIMPLE_CLASSES.index('silty')
+    indices[clay > 35] = SIMPLE_CLASSES.index('clayey')
+    return indices
+
+
+def _lookup_table(rules):
+    """ Tabulate class indices for every whole-percent (sand, clay) combination, with silt making up the remainder.
+    Impossible combinations, where sand and clay exceed 100%, are assigned -1
+    """
+    sand, clay = np.meshgrid(np.arange(101), np.arange(101), indexing='ij')
+    table = rules(sand, 100 - sand - clay, clay)
+    table[sand + clay > 100] = -1
+    table.flags.writeable = False
+    return table
+
+
+USDA_TABLE = _lookup_table(usda_rules)
+SIMPLE_TABLE = _lookup_table(simple_rules)
+
+
+def _texture_percents(textures):
+    """ Convert an (N, 3) array of soil textures to whole-percent sand and clay content, rounding halves up.  Clay is
+    trimmed where rounding alone pushes sand and clay together past 100%, so every valid texture has a class
+    """
+    textures = np.asarray(textures, dtype=float).reshape(-1, 3)
+    sand = np.clip(np.floor(textures[:, 0]*100 + 0.5), 0, 100).astype(np.intp)
+    clay = np.clip(np.floor(textures[:, 2]*100 + 0.5), 0, 100).astype(np.intp)
+    rounded_over = (sand + clay > 100) & (textures[:, 0] + textures[:, 2] <= 1 + 1e-9)
+    clay[rounded_over] = 100 - sand[rounded_over]
+    return sand, clay
+
+
+def usda_class_indices(textures):
+    """ Return an (N,) array of indices into USDA_CLASSES for an (N, 3) array of (sand, silt, clay) textures, or -1
+    where sand and clay content together exceed 100%
+    """
+    sand, clay = _texture_percents(textures)
+    return USDA_TABLE[sand, clay]
+
+
+def simple_class_indices(textures):
+    """ Return an (N,) array of indices into SIMPLE_CLASSES for an (N, 3) array of (sand, silt, clay) textures, or -1
+    where sand and clay content together exceed 100%
+    """
+    sand, clay = _texture_percents(textures)
+    return SIMPLE_TABLE[sand, clay]
+
+
+def classify(textures, system='usda'):
+    """ Return an (N,) array of class names for an (N, 3) array of (sand, silt, clay) textures, using either the 'usda'
+    or 'simple' classification system.  Unclassifiable textures are named ''
+    """
+    if system == 'usda':
+        names, indices = USDA_CLASSES, usda_class_indices(textures)
+    else:
+        names, indices = SIMPLE_CLASSES, simple_class_indices(textures)
+    return np.asarray(names + ('',), dtype=object)[indices]
+
+
+def class_areas(textures, areas, system='usda'):
+    """ Total the areas associated with an (N, 3) array of (sand, silt, clay) textures by soil texture class, returning
+    a dictionary of class name: total area for every class in the 'usda' or 'simple' classification system
+    """
+    if system == 'usda':
+        names, indices = USDA_CLASSES, usda_class_indices(textures)
+    else:
+        names, indices = SIMPLE_CLASSES, simple_class_indices(textures)
+    valid = indices >= 0
+    totals = np.bincount(indices[valid], weights=np.asarray(areas, dtype=float)[valid], minlength=len(names))
+    return dict(zip(names, totals))
+
+
+def test():
+    # textures on and either side of class boundaries, with the class each should fall in
+    usda_checks = [
+        [(1.0, 0, 0), 'sand'],
+        [(.40, .40, .20), 'loam'],
+        [(0, 1.0, 0), 'silt'],
+        [(.20, .40, .40), 'silty clay'],
+        [(.30, .30, .40), 'clay'],
+        [(.505, 0, .495), 'sandy clay'],  # sand and clay round to 101% in total
+    ]
+    simple_checks = [
+        [(.65, .35, 0), 'loamy'],
+        [(.66, .34, 0), 'sandy'],
+        [(.30, .35, .35), 'loamy'],
+        [(.30, .34, .36), 'clayey'],
+        [(0, .65, .35), 'loamy'],
+        [(0, .66, .34), 'silty'],
+    ]
+    for system, checks in (('usda', usda_checks), ('simple', simple_checks)):
+        textures, expected = zip(*checks)
+        names = classify(textures, system)
+        for texture, name, expected_name in zip(textures, names, expected):
+            assert name == expected_name, "%s texture %s classed '%s', not '%s'" % (system, texture, name,
+                                                                                  expected_name)
+    print "All soil texture class checks passed"
+
+
+if __name__ == '__main__':
+    test()
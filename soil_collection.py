@@ -0,0 +1,126 @@
+#!/bin/python
+
+""" Compact, array-backed collection of soils.  A SoilCollection holds the sand, silt and clay content (in percent),
+size and color value of each soil as contiguous NumPy arrays, and identifies soil textures by packed integer keys at
+1% resolution, so soils can be grouped, sorted, sliced, filtered and concatenated without any per-soil Python objects,
+e.g.
+
+    soils = SoilCollection(sand, silt, clay, area, nitrogen).aggregate()
+    soil_plotter.soil_plotter(soils[soils.size > 0])
+"""
+
+
+import numpy as np
+
+
+# packed texture keys hold whole-percent sand, silt and clay content in base KEY_BASE digits (100% needs three digits)
+KEY_BASE = 1000
+
+
+def texture_keys(sand, silt, clay):
+    """ Pack arrays of sand, silt and clay content in percent into integer texture keys, at whole-percent resolution
+    (rounding halves up).  Keys sort by sand, then silt, then clay content
+    """
+    percents = [np.floor(np.asarray(column, dtype=float) + 0.5).astype(np.int64) for column in (sand, silt, clay)]
+    return (percents[0] * KEY_BASE + percents[1]) * KEY_BASE + percents[2]
+
+
+def key_percents(keys):
+    """ Unpack an array of integer texture keys into arrays of whole-percent sand, silt and clay content
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys // (KEY_BASE * KEY_BASE), keys // KEY_BASE % KEY_BASE, keys % KEY_BASE
+
+
+class SoilCollection(object):
+    """ Soils stored as parallel arrays of sand, silt and clay content in percent, size and color value.  Indexing with
+    an integer returns a (texture, size, color) tuple, with the texture as (sand, silt, clay) fractions; indexing with
+    a slice, boolean mask or array of indices returns a new SoilCollection
+    """
+    def __init__(self, sand, silt, clay, size, color):
+        self.sand, self.silt, self.clay, self.size, self.color = \
+            [np.ascontiguousarray(column, dtype=float).reshape(-1) for column in (sand, silt, clay, size, color)]
+        if not len(self.sand) == len(self.silt) == len(self.clay) == len(self.size) == len(self.color):
+            raise ValueError("Soil data arrays must all be the same length")
+
+    @classmethod
+    def from_textures(cls, textures, sizes, color_scalars):
+        """ Create a collection from an (N, 3) array or sequence of (sand, silt, clay) fractions and sequences of sizes
+        and color values
+        """
+        textures = np.asarray(textures, dtype=float).reshape(-1, 3) * 100
+        return cls(textures[:, 0], textures[:, 1], textures[:, 2], sizes, color_scalars)
+
+    @classmethod
+    def from_totals(cls, keys, sizes, weighted_colors, color_sums, counts):
+        """ Create a collection of unique soils from an array of texture keys and arrays of each soil's total size, sum
+        of size*color, sum of color values and row count.  Each soil's color is its size-weighted mean color value, or
+        the simple mean for soils with no size.  The collection is sorted by size (largest first)
+        """
+        sizes = np.asarray(sizes, dtype=float)
+        colors = np.asarray(color_sums, dtype=float) / np.maximum(counts, 1)
+        has_size = sizes != 0
+        colors[has_size] = np.asarray(weighted_colors, dtype=float)[has_size] / sizes[has_size]
+        sand, silt, clay = key_percents(keys)
+        return cls(sand, silt, clay, sizes, colors).sort_by_size()
+
+    @staticmethod
+    def concatenate(collections):
+        """ Join a sequence of collections end to end into a new collection
+        """
+        collections = list(collections)
+        return SoilCollection(*[np.concatenate([getattr(soils, column) for soils in collections] or [[]])
+                                for column in ('sand', 'silt', 'clay', 'size', 'color')])
+
+    def __len__(self):
+        return len(self.size)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, np.integer)):
+            return (self.sand[index]/100.0, self.silt[index]/100.0, self.clay[index]/100.0), \
+                self.size[index], self.color[index]
+        return SoilCollection(self.sand[index], self.silt[index], self.clay[index], self.size[index],
+                              self.color[index])
+
+    def __repr__(self):
+        return '<SoilCollection of %i soils, total size %g>' % (len(self), self.size.sum())
+
+    @property
+    def textures(self):
+        """ (N, 3) array of (sand, silt, clay) fractions
+        """
+        return np.column_stack((self.sand, self.silt, self.clay)) / 100.0
+
+    @property
+    def keys(self):
+        """ (N,) array of packed integer texture keys, at 1% resolution
+        """
+        return texture_keys(self.sand, self.silt, self.clay)
+
+    def filter(self, mask):
+        """ Return a new collection of the soils selected by a boolean mask
+        """
+        return self[np.asarray(mask, dtype=bool)]
+
+    def scaled(self, factor):
+        """ Return a new collection with every size multiplied by factor
+        """
+        return SoilCollection(self.sand, self.silt, self.clay, self.size * factor, self.color)
+
+    def sort_by_size(self, reverse=True):
+        """ Return a new collection sorted by size, largest first unless reverse=False, and by texture key among soils
+        of equal size
+        """
+        return self[np.lexsort((self.keys, -self.size if reverse else self.size))]
+
+    def aggregate(self, groups=None):
+        """ Group soils on texture quantized to 1%, returning a new collection of each unique soil's total size and
+        mean color value, as for from_totals().  A grouping already computed for the same soils, e.g. when aggregating
+        several metrics, can be given as the (unique keys, inverse) arrays of np.unique(keys, return_inverse=True)
+        """
+        unique_keys, inverse = groups if groups is not None else np.unique(self.keys, return_inverse=True)
+        count = len(unique_keys)
+        return SoilCollection.from_totals(unique_keys, np.bincount(inverse, weights=self.size, minlength=count),
+                                          np.bincount(inverse, weights=self.size*self.color, minlength=count),
+                                          np.bincount(inverse, weights=self.color, minlength=count),
+                                          np.bincount(inverse, minlength=count))
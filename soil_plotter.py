@@ -1,11 +1,16 @@
 #!/bin/python
 
 """ Routine to plot a distribution of soil on a soil texture triangle, with custom point sizing and coloring.  Textures
-must be defined as tuples of (sand fraction, silt fraction, clay fraction).
+must be defined as tuples of (sand fraction, silt fraction, clay fraction).  Every plotting function draws into the
+axes it is given, so figures created with new_figure() can be built side by side, in any thread, without pyplot;
+pyplot's current axes are only used when no axes are given.  matplotlib is only imported on first use, so the color,
+coordinate and geometry helpers can be used without it.
 """
 
 
-import matplotlib.pyplot as plt
+import numpy as np
+import profiling
+from soil_collection import SoilCollection
 
 
 # RGV values defining a custom colorblind-safe color palette, modified from
@@ -21,46 +26,79 @@ c8 = (240/255.0, 228/255.0, 66/255.0)   # yellow
 c2_light = (185/255.0, 216/255.0, 233/255.0)    # custom light blue
 
 
+def color_scale_array(high_color_rgb, low_color_rgb, scalars, scalar_range, alpha=None):
+    """ Define an (N, 3) array of RGB colors between high_color_rgb and low_color_rgb corresponding to where each of the
+    (N,) scalars sits within the scalar_range, clamped at both ends of the range.  If an alpha value is given, an (N, 4)
+    array of RGBA colors is returned instead
+    """
+    scalars = np.asarray(scalars, dtype=float).reshape(-1)
+    low = np.asarray(low_color_rgb[:3], dtype=float)
+    high = np.asarray(high_color_rgb[:3], dtype=float)
+    width = float(scalar_range[1] - scalar_range[0])
+    if width:
+        span = np.clip((scalars-scalar_range[0]) / width, 0.0, 1.0)
+    else:
+        span = np.zeros(scalars.shape)
+    colors = low + span[:, np.newaxis] * (high-low)
+    if alpha is not None:
+        colors = np.column_stack((colors, np.resize(np.asarray(alpha, dtype=float), scalars.shape)))
+    return colors
+
+
 def color_scale(high_color_rgb, low_color_rgb, scalar, scalar_range):
     """ Define a color between high_color_rgb and low_color_rgb corresponding to where the scalar value sits withing
     the scalar_range
     """
-    span = min((scalar-scalar_range[0]) / (scalar_range[1]-scalar_range[0]), 1.0)
-    red = low_color_rgb[0] + span * (high_color_rgb[0]-low_color_rgb[0])
-    green = low_color_rgb[1] + span * (high_color_rgb[1]-low_color_rgb[1])
-    blue = low_color_rgb[2] + span * (high_color_rgb[2]-low_color_rgb[2])
-    color = (red, green, blue)
-    return color
+    color = color_scale_array(high_color_rgb, low_color_rgb, [scalar], scalar_range)[0]
+    return tuple(color)
 
 
-def transpose(texture):
-    """ Convert soil texture tuples in the form (sand, silt, clay) to cartesian coordinates (x, y)
+def new_figure(figsize=None, dpi=None):
+    """ Create a new figure with its own Agg canvas, independent of pyplot, so that it is freed as soon as it is no
+    longer referenced
     """
-    sand, silt, clay = texture
-    x = (-clay/2.0) - sand
-    y = clay
-    return x, y
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
 
 
-def plot_triangle_axes(font_size=14, color='k', zorder=1):
-    """ Plot triangular axes, then add axis labels
+def current_axes(ax=None):
+    """ Return the given axes, or fall back on pyplot's current axes when none is given
     """
-    # plot outer axis boundaries
-    corners = [(0, 0), (-1, 0), (-.5, 1), (0, 0)]
-    xy = zip(*corners)
-    plt.plot(xy[0], xy[1], color=color, marker=None, linewidth=1.5, zorder=zorder)
-    plt.axis('off')
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    return ax
 
-    # add triangular axis labels
-    plt.text(-0.48, -0.15, 'sand %', ha='center', va='center', fontsize=font_size, color=color)
-    plt.text(-0.9, 0.55, 'clay %', ha='center', va='center', fontsize=font_size, color=color, rotation=60)
-    plt.text(-0.1, 0.55, 'silt %', ha='center', va='center', fontsize=font_size, color=color, rotation=-60)
+
+def transpose_array(textures):
+    """ Convert an (N, 3) array of soil textures in the form (sand, silt, clay) to an (N, 2) array of cartesian
+    coordinates (x, y)
+    """
+    textures = np.asarray(textures, dtype=float).reshape(-1, 3)
+    xy = np.empty((len(textures), 2))
+    xy[:, 0] = (-textures[:, 2]/2.0) - textures[:, 0]
+    xy[:, 1] = textures[:, 2]
+    return xy
 
 
-def plot_triangle_grid(font_size=12, color='silver', font_color='k', zorder=0):
-    """ Plot triangular axes, then add axis labels and background grid
+def transpose(texture):
+    """ Convert soil texture tuples in the form (sand, silt, clay) to cartesian coordinates (x, y)
     """
-    sand_grid = [
+    x, y = transpose_array([texture])[0]
+    return x, y
+
+
+# soil texture triangle geometry, with lines defined by (sand, silt, clay) texture vertices and labels by texture or
+# cartesian (x, y) positions.  Grid line ends sit just outside the triangle, where each line's label is placed
+TRIANGLE_OUTLINE = [(0, 1, 0), (1, 0, 0), (0, 0, 1), (0, 1, 0)]
+TRIANGLE_AXIS_LABELS = [('sand %', (-0.48, -0.15), 0), ('clay %', (-0.9, 0.55), 60), ('silt %', (-0.1, 0.55), -60)]
+
+TRIANGLE_GRID = {
+    'sand': [
         [(.9, 0, .1), (.9, .1, -0.05), '90'],
         [(.8, 0, .2), (.8, .2, -0.05), '80'],
         [(.7, 0, .3), (.7, .3, -0.05), '70'],
@@ -70,14 +108,8 @@ def plot_triangle_grid(font_size=12, color='silver', font_color='k', zorder=0):
         [(.3, 0, .7), (.3, .7, -0.05), '30'],
         [(.2, 0, .8), (.2, .8, -0.05), '20'],
         [(.1, 0, .9), (.1, .9, -0.05), '10'],
-    ]
-    for gridline_parameters in sand_grid:
-        x0, y0 = transpose(gridline_parameters[0])
-        x1, y1 = transpose(gridline_parameters[1])
-        plt.plot((x0, x1), (y0, y1), color=color, marker=None, linewidth=0.5, zorder=zorder)
-        plt.text(x1, y1, gridline_parameters[2], ha='left', va='top', color=font_color, fontsize=font_size)
-
-    silt_grid = [
+    ],
+    'silt': [
         [(.1, .9, 0), (-0.05, .9, .15), '90'],
         [(.2, .8, 0), (-0.05, .8, .25), '80'],
         [(.3, .7, 0), (-0.05, .7, .35), '70'],
@@ -87,108 +119,341 @@ def plot_triangle_grid(font_size=12, color='silver', font_color='k', zorder=0):
         [(.7, .3, 0), (-0.05, .3, .75), '30'],
         [(.8, .2, 0), (-0.05, .2, .85), '20'],
         [(.9, .1, 0), (-0.05, .1, .95), '10'],
-    ]
-    for gridline_parameters in silt_grid:
-        x0, y0 = transpose(gridline_parameters[0])
-        x1, y1 = transpose(gridline_parameters[1])
-        plt.plot((x0, x1), (y0, y1), color=color, marker=None, linewidth=0.5, zorder=zorder)
-        plt.text(x1, y1, gridline_parameters[2], ha='left', va='bottom', color=font_color, fontsize=font_size)
-
-    clay_grid = [
+    ],
+    'clay': [
         [(0, .1, .9), (.15, 0, .9), '90'],
         [(0, .2, .8), (.25, 0, .8), '80'],
         [(0, .3, .7), (.35, 0, .7), '70'],
-        [(0, .3, .6), (.45, 0, .6), '60'],
+        [(0, .4, .6), (.45, 0, .6), '60'],
         [(0, .5, .5), (.55, 0, .5), '50'],
         [(0, .6, .4), (.65, 0, .4), '40'],
         [(0, .7, .3), (.75, 0, .3), '30'],
         [(0, .8, .2), (.85, 0, .2), '20'],
         [(0, .9, .1), (.95, 0, .1), '10'],
-    ]
-    for gridline_parameters in clay_grid:
-        x0, y0 = transpose(gridline_parameters[0])
-        x1, y1 = transpose(gridline_parameters[1])
-        plt.plot((x0, x1), (y0, y1), color=color, marker=None, linewidth=0.5, zorder=zorder)
-        plt.text(x1, y1, gridline_parameters[2], ha='right', va='bottom', color=font_color, fontsize=font_size)
+    ],
+}
+# (horizontal, vertical) alignment of the grid labels along each axis
+TRIANGLE_GRID_ALIGNMENT = {'sand': ('left', 'top'), 'silt': ('left', 'bottom'), 'clay': ('right', 'bottom')}
+
+SIMPLE_CLASS_BOUNDARY = [(.65, .35, 0), (.65, 0, .35), (0, .65, .35), (.35, .65, 0)]
+SIMPLE_CLASS_LABELS = [('loamy', (-0.5, 0.175)), ('sandy', (-0.825, 0.125)), ('clayey', (-0.5, 0.55)),
+                       ('silty', (-0.175, 0.125))]
+
+USDA_CLASS_BOUNDARIES = [
+    [(.85, .15, 0), (0.9, 0, 0.1)],                     # sand
+    [(.7, 0.3, 0), (.85, 0, .15)],                      # loamy sand
+    [(.2, .8, 0), (.08, .8, .12), (0, .88, .12)],       # silt
+    [(.45, 0, .55), (.45, .28, .27), (0, .73, .27)],    # middle
+    [(.5, .5, 0), (.23, .5, .27)],                      # silt loam
+    [(.45, .15, .4), (0, .6, .4)],                      # clay
+    [(0, .4, .6), (.2, .4, .4), (.2, .53, .27)],        # silts
+    [(.65, 0, .35), (.45, .2, .35)],                    # sandy clay
+    [(.8, 0, .2), (.52, .28, .2), (.45, .28, .27)],     # sandy loam
+    [(.52, .28, .2), (.52, .41, .07), (.43, .5, .07)],  # loam
+]
+USDA_CLASS_LABELS = [
+    ("sand", (.92, .05, .03)),
+    ("loamy\nsand", (.81, .15, .04)),
+    ("sandy\nloam", (.62, .26, .12)),
+    ("sandy\nclay loam", (.6, .12, .28)),
+    ("sandy\nclay", (.52, .07, .41)),
+    ("loam", (.41, .42, .17)),
+    ("clay\nloam", (.33, .33, .34)),
+    ("clay", (.23, .23, .54)),
+    ("silt", (.08, .87, .05)),
+    ("silt\nloam", (.23, .63, .14)),
+    ("silty\nclay", (.06, .47, .47)),
+    ("silty\nclay loam", (.1, .57, .33)),
+]
+
+
+def _triangle_geometry():
+    """ Convert the triangle geometry tables to cartesian line vertices and label positions, once at import time
+    """
+    geometry = {'outline': transpose_array(TRIANGLE_OUTLINE), 'grid_labels': []}
+    grid_segments = []
+    for axis in ('sand', 'silt', 'clay'):
+        starts, ends, labels = zip(*TRIANGLE_GRID[axis])
+        ends = transpose_array(ends)
+        grid_segments.extend(np.stack((transpose_array(starts), ends), axis=1))
+        geometry['grid_labels'].extend((x, y, label) + TRIANGLE_GRID_ALIGNMENT[axis]
+                                       for (x, y), label in zip(ends, labels))
+    geometry['grid'] = np.array(grid_segments)
+    geometry['simple_boundary'] = transpose_array(SIMPLE_CLASS_BOUNDARY)
+    geometry['usda_boundaries'] = [transpose_array(vertices) for vertices in USDA_CLASS_BOUNDARIES]
+    names, centers = zip(*USDA_CLASS_LABELS)
+    geometry['usda_labels'] = zip(names, transpose_array(centers))
+    return geometry
+
+
+TRIANGLE_GEOMETRY = _triangle_geometry()
+
+
+def _add_lines(ax, lines, **kwargs):
+    """ Add a list of polylines, each an (N, 2) array of cartesian vertices, to an axes as a single LineCollection
+    """
+    from matplotlib.collections import LineCollection
+
+    # use the same projecting line ends as plot() lines
+    collection = LineCollection(lines, capstyle='projecting', **kwargs)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+
+@profiling.profiled()
+def plot_triangle_axes(font_size=14, color='k', zorder=1, ax=None):
+    """ Plot triangular axes, then add axis labels, in the given axes or the current axes
+    """
+    ax = current_axes(ax)
+
+    # plot outer axis boundaries
+    outline = TRIANGLE_GEOMETRY['outline']
+    ax.plot(outline[:, 0], outline[:, 1], color=color, marker=None, linewidth=1.5, zorder=zorder)
+    ax.axis('off')
+
+    # add triangular axis labels
+    for label, (x, y), rotation in TRIANGLE_AXIS_LABELS:
+        ax.text(x, y, label, ha='center', va='center', fontsize=font_size, color=color, rotation=rotation)
+
+
+@profiling.profiled()
+def plot_triangle_grid(font_size=12, color='silver', font_color='k', zorder=0, ax=None):
+    """ Plot the background grid of the triangle, with grid lines labelled, in the given axes or the current axes.  All
+    grid lines are drawn as a single collection
+    """
+    ax = current_axes(ax)
+    _add_lines(ax, TRIANGLE_GEOMETRY['grid'], colors=color, linewidths=0.5, zorder=zorder)
+    for x, y, label, horizontal, vertical in TRIANGLE_GEOMETRY['grid_labels']:
+        ax.text(x, y, label, ha=horizontal, va=vertical, color=font_color, fontsize=font_size)
 
 
-def plot_simple_classes(font_size=10, color='k', zorder=2):
+@profiling.profiled()
+def plot_simple_classes(font_size=10, color='k', zorder=2, ax=None):
     """ Plot boundaries and labels for simplified soil texture groupings, defined wuch that soils with > 65% sand
     content are designated 'sandy', those with > 35% clay content are 'clayey', those with > 65% silt content are
     'silty', and all others are 'loamy'
     """
-    boundaries = [(-0.65, 0), (-0.825, 0.35), (-0.175, 0.35), (-0.35, 0)]
-    xy = zip(*boundaries)
-    plt.plot(xy[0], xy[1], color='k', marker=None, linewidth=1, zorder=-1)
-    plt.text(-0.5, 0.175, 'loamy', color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
-    plt.text(-0.825, 0.125, 'sandy', color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
-    plt.text(-0.5, 0.55, 'clayey', color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
-    plt.text(-0.175, 0.125, 'silty', color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
+    ax = current_axes(ax)
+    boundary = TRIANGLE_GEOMETRY['simple_boundary']
+    ax.plot(boundary[:, 0], boundary[:, 1], color='k', marker=None, linewidth=1, zorder=-1)
+    for label, (x, y) in SIMPLE_CLASS_LABELS:
+        ax.text(x, y, label, color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
 
 
-def plot_usda_classes(font_size=10, color='k', zorder=2):
+@profiling.profiled()
+def plot_usda_classes(font_size=10, color='k', zorder=2, ax=None):
     """ Plot boundaries and labels for the standard USDA soil texture grouping system with its 12 different soil
-    texture classes (e.g., 'sandy loam', 'sandy clay loam', 'sandy clay', etc.)
-    """
-    soil_class_boundaries = {
-        "sand": [(.85, .15, 0), (0.9, 0, 0.1)],
-        "loamy sand": [(.7, 0.3, 0), (.85, 0, .15)],
-        "silt": [(.2, .8, 0), (.08, .8, .12), (0, .88, .12)],
-        "middle": [(.45, 0, .55), (.45, .28, .27), (0, .73, .27)],
-        "silt loam": [(.5, .5, 0), (.23, .5, .27)],
-        "clay": [(.45, .15, .4), (0, .6, .4)],
-        "silts": [(0, .4, .6), (.2, .4, .4), (.2, .53, .27)],
-        "sandy clay": [(.65, 0, .35), (.45, .2, .35)],
-        "sandy loam": [(.8, 0, .2), (.52, .28, .2), (.45, .28, .27)],
-        "loam": [(.52, .28, .2), (.52, .41, .07), (.43, .5, .07)]
-    }
-
-    for key in soil_class_boundaries:
-        vertex_list = soil_class_boundaries[key]
-        vertices_x = []
-        vertices_y = []
-        for vertex in vertex_list:
-            x, y = transpose(vertex)
-            vertices_x.append(x)
-            vertices_y.append(y)
-        plt.plot(vertices_x, vertices_y, color=color, marker=None, linewidth=0.5, zorder=zorder)
-
-    soil_class_lables = {
-        "sand": (.92, .05, .03),
-        "loamy\nsand": (.81, .15, .04),
-        "sandy\nloam": (.62, .26, .12),
-        "sandy\nclay loam": (.6, .12, .28),
-        "sandy\nclay": (.52, .07, .41),
-        "loam": (.41, .42, .17),
-        "clay\nloam": (.33, .33, .34),
-        "clay": (.23, .23, .54),
-        "silt": (.08, .87, .05),
-        "silt\nloam": (.23, .63, .14),
-        "silty\nclay": (.06, .47, .47),
-        "silty\nclay loam": (.1, .57, .33),
-    }
-
-    for key in soil_class_lables:
-        center = soil_class_lables[key]
-        x, y = transpose(center)
-        plt.text(x, y, key, color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
-
-
-def soil_plotter(textures, sizes, color_scalars, custom_scalar_range='', zorder=1):
+    texture classes (e.g., 'sandy loam', 'sandy clay loam', 'sandy clay', etc.).  All boundaries are drawn as a single
+    collection
+    """
+    ax = current_axes(ax)
+    _add_lines(ax, TRIANGLE_GEOMETRY['usda_boundaries'], colors=color, linewidths=0.5, zorder=zorder)
+    for label, (x, y) in TRIANGLE_GEOMETRY['usda_labels']:
+        ax.text(x, y, label, color=color, ha='center', va='center', fontsize=font_size, zorder=zorder)
+
+
+# data coordinates (xmin, xmax, ymin, ymax) of the triangle plot area, and of the larger area covered by cached
+# background rasters so that axis and grid labels outside the plot area are included
+TRIANGLE_LIMITS = (-1.05, 0.05, -0.1025, 1.0525)
+BACKGROUND_EXTENT = (-1.2, 0.2, -0.25, 1.1)
+
+# pre-rendered background rasters, keyed on (classes, (width, height) in pixels, dpi)
+_background_cache = {}
+
+
+@profiling.profiled()
+def triangle_background(classes='simple', size=(555, 473), dpi=100):
+    """ Render the static triangle axes, grid and class boundaries ('simple', 'usda' or None) into an RGBA raster of
+    the given pixel size spanning BACKGROUND_EXTENT.  Rasters are rendered once per class style, size and dpi and then
+    served from a cache
+    """
+    key = (classes, tuple(size), dpi)
+    if key not in _background_cache:
+        fig = new_figure(figsize=(size[0]/float(dpi), size[1]/float(dpi)), dpi=dpi)
+        fig.patch.set_visible(False)
+        ax = fig.add_axes([0, 0, 1, 1])
+        plot_triangle_axes(ax=ax)
+        plot_triangle_grid(ax=ax)
+        if classes == 'simple':
+            plot_simple_classes(ax=ax)
+        elif classes == 'usda':
+            plot_usda_classes(ax=ax)
+        ax.set_xlim(BACKGROUND_EXTENT[:2])
+        ax.set_ylim(BACKGROUND_EXTENT[2:])
+
+        fig.canvas.draw()
+        width, height = fig.canvas.get_width_height()
+        raster = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4).copy()
+        raster.flags.writeable = False
+        _background_cache[key] = raster
+    return _background_cache[key]
+
+
+@profiling.profiled()
+def plot_triangle_background(classes='simple', ax=None):
+    """ Draw the triangle axes, grid and class boundaries beneath the given (or current) axes as a single cached image,
+    rendered at the figure's resolution in a background axes spanning BACKGROUND_EXTENT.  The axes limits are fixed to
+    TRIANGLE_LIMITS and it remains its figure's current axes, so data drawn afterwards lands on top of the background
+    """
+    ax = current_axes(ax)
+    ax.set_xlim(TRIANGLE_LIMITS[:2])
+    ax.set_ylim(TRIANGLE_LIMITS[2:])
+    ax.axis('off')
+
+    # position a background axes so that one data unit spans the same fraction of the figure as in the current axes
+    position = ax.get_position()
+    x_scale = position.width / (TRIANGLE_LIMITS[1]-TRIANGLE_LIMITS[0])
+    y_scale = position.height / (TRIANGLE_LIMITS[3]-TRIANGLE_LIMITS[2])
+    background_position = [position.x0 + (BACKGROUND_EXTENT[0]-TRIANGLE_LIMITS[0])*x_scale,
+                           position.y0 + (BACKGROUND_EXTENT[2]-TRIANGLE_LIMITS[2])*y_scale,
+                           (BACKGROUND_EXTENT[1]-BACKGROUND_EXTENT[0])*x_scale,
+                           (BACKGROUND_EXTENT[3]-BACKGROUND_EXTENT[2])*y_scale]
+    fig = ax.figure
+    background_ax = fig.add_axes(background_position, label='triangle background', zorder=ax.get_zorder()-1)
+    background_ax.axis('off')
+
+    size = (int(round(background_position[2]*fig.bbox.width)), int(round(background_position[3]*fig.bbox.height)))
+    raster = triangle_background(classes, size, fig.dpi)
+    image = background_ax.imshow(raster, extent=BACKGROUND_EXTENT, origin='upper', aspect='auto',
+                                 interpolation='nearest')
+    fig.sca(ax)
+    return image
+
+
+@profiling.profiled()
+def soil_plotter(textures, sizes=None, color_scalars=None, custom_scalar_range='', zorder=1, ax=None):
     """ Plot each soil in 'textures' with a filled circular marker of point size defined in 'sizes' and RGB color
-    defined in 'color_scalars'
+    defined in 'color_scalars', in the given axes or the current axes; 'textures' may instead be a SoilCollection
+    holding all three.  All coordinates and colors are computed as arrays and drawn as a single scatter collection;
+    points are drawn in the order given, so callers should sort largest-first to keep small points visible
     """
     print 'Creating soil texture triangle point cloud...'
+    xy, sizes, colors = _point_data(textures, sizes, color_scalars, custom_scalar_range)
+    profiling.current_stage().rows = len(sizes)
+    points = current_axes(ax).scatter(xy[:, 0], xy[:, 1], s=sizes, color=colors, zorder=zorder)
+    print
+    return points
+
+
+def update_soil_points(points, textures, sizes=None, color_scalars=None, custom_scalar_range=''):
+    """ Replace the soils drawn in a point collection returned by soil_plotter() with new soils, given as for
+    soil_plotter(), by updating the positions, sizes and colors of its points in place
+    """
+    xy, sizes, colors = _point_data(textures, sizes, color_scalars, custom_scalar_range)
+    points.set_offsets(xy)
+    points.set_sizes(sizes)
+    points.set_color(colors)
+    return points
+
+
+def _point_data(textures, sizes, color_scalars, custom_scalar_range):
+    """ Compute the (N, 2) cartesian positions, sizes and (N, 3) RGB colors of soil points, from textures, sizes and
+    color values or a SoilCollection
+    """
+    if isinstance(textures, SoilCollection):
+        textures, sizes, color_scalars = textures.textures, textures.size, textures.color
+    sizes = np.asarray(sizes, dtype=float)
+    color_scalars = np.asarray(color_scalars, dtype=float)
     if custom_scalar_range:
         color_scalar_range = custom_scalar_range
     else:
-        color_scalar_range = (min(color_scalars), max(color_scalars))
+        color_scalar_range = (color_scalars.min(), color_scalars.max())
+    return transpose_array(textures), sizes, color_scale_array(c2, c2_light, color_scalars, color_scalar_range)
+
+
+# density map cells are drawn with an area proportional to the log of the size they hold, across DENSITY_DECADES
+# orders of magnitude below the largest cell, down to MIN_CELL_AREA of a full cell
+DENSITY_DECADES = 3
+MIN_CELL_AREA = 0.1
+
+
+def ternary_bins(textures, bins=50):
+    """ Assign each (sand, silt, clay) texture to one of bins**2 triangular cells tiling the soil texture triangle, with
+    cells numbered ((clay bin * bins) + sand bin) * 2, plus 1 for downward-pointing cells.  Returns an (N,) array of
+    cell numbers
+    """
+    textures = np.asarray(textures, dtype=float).reshape(-1, 3)
+    sand = np.clip(textures[:, 0], 0, 1)
+    clay = np.clip(textures[:, 2], 0, 1)
+
+    # rescale any textures with more than 100% sand and clay, and keep points on the triangle edges inside its cells
+    total = sand + clay
+    scale = bins * (1 - 1e-9) / np.maximum(total, 1.0)
+    sand *= scale
+    clay *= scale
+    i = np.floor(sand)
+    j = np.floor(clay)
+    down = (sand - i) + (clay - j) >= 1
+    return ((j * bins + i) * 2 + down).astype(np.intp)
+
+
+def ternary_cell_vertices(cells, bins=50):
+    """ Return an (N, 3, 3) array of the (sand, silt, clay) texture vertices of each numbered triangular cell
+    """
+    cells = np.asarray(cells, dtype=np.intp)
+    down = cells % 2
+    i = (cells // 2) % bins
+    j = (cells // 2) // bins
+
+    # (sand, clay) offsets of each cell corner, in bin units
+    sand_offsets = np.where(down[:, np.newaxis], [1, 0, 1], [0, 1, 0])
+    clay_offsets = np.where(down[:, np.newaxis], [0, 1, 1], [0, 0, 1])
+    sand = (i[:, np.newaxis] + sand_offsets) / float(bins)
+    clay = (j[:, np.newaxis] + clay_offsets) / float(bins)
+    return np.dstack((sand, 1 - sand - clay, clay))
+
+
+@profiling.profiled()
+def soil_density_plotter(textures, sizes=None, color_scalars=None, bins=50, custom_scalar_range='', zorder=1,
+                         ax=None):
+    """ Plot the soils in 'textures' (or a SoilCollection) as a density map in the given axes or the current axes,
+    binning them into a grid of bins**2 triangular cells.  Each cell holding any size is drawn opaque, colored by the
+    size-weighted mean of its 'color_scalars' on the same scale as the legend, and shrunk about its center so that its
+    area shows the log of its total size relative to the largest cell (see DENSITY_DECADES and MIN_CELL_AREA), as
+    point sizes do in soil_plotter().  Cells are drawn as a single collection clipped to the triangle axes, so render
+    cost depends only on the number of occupied cells
+    """
+    from matplotlib.collections import PolyCollection
+    from matplotlib.patches import Polygon
+
+    print 'Creating soil texture triangle density map...'
+    if isinstance(textures, SoilCollection):
+        textures, sizes, color_scalars = textures.textures, textures.size, textures.color
+    sizes = np.asarray(sizes, dtype=float)
+    profiling.current_stage().rows = len(sizes)
+    color_scalars = np.asarray(color_scalars, dtype=float)
+
+    # accumulate total size and size-weighted color in each cell
+    cells = ternary_bins(textures, bins)
+    cell_sizes = np.bincount(cells, weights=sizes, minlength=2*bins*bins)
+    cell_colors = np.bincount(cells, weights=sizes*color_scalars, minlength=2*bins*bins)
+    occupied = np.nonzero(cell_sizes > 0)[0]
+    cell_sizes = cell_sizes[occupied]
+    cell_colors = cell_colors[occupied] / cell_sizes
+
+    if custom_scalar_range:
+        color_scalar_range = custom_scalar_range
+    else:
+        color_scalar_range = (cell_colors.min(), cell_colors.max())
+    colors = color_scale_array(c2, c2_light, cell_colors, color_scalar_range)
+
+    # shrink each cell about its center to show its share of the largest cell's size on a log scale
+    shares = np.clip(1 + np.log10(cell_sizes / cell_sizes.max()) / DENSITY_DECADES, 0, 1)
+    scales = np.sqrt(MIN_CELL_AREA + (1 - MIN_CELL_AREA) * shares)[:, np.newaxis, np.newaxis]
+    textures = ternary_cell_vertices(occupied, bins)
+    centers = textures.mean(axis=1)[:, np.newaxis, :]
+    textures = centers + scales * (textures - centers)
 
-    for e, texture in enumerate(textures):
-        x, y = transpose(texture)
-        color = color_scale(c2, c2_light, color_scalars[e], color_scalar_range)
-        plt.scatter(x, y, s=sizes[e], color=color, zorder=zorder)
+    # draw all occupied cells as one collection, clipped to the triangle
+    vertices = transpose_array(textures.reshape(-1, 3)).reshape(-1, 3, 2)
+    ax = current_axes(ax)
+    density = PolyCollection(vertices, facecolors=colors, edgecolors='none', zorder=zorder)
+    ax.add_collection(density)
+    density.set_clip_path(Polygon([(0, 0), (-1, 0), (-.5, 1)], transform=ax.transData))
+    ax.autoscale_view()
     print
+    return density
 
 
 def test(figure_name):
@@ -200,11 +465,13 @@ def test(figure_name):
     ]
     dummy_textures, dummy_sizes, dummy_color_scalars = zip(*dummy_data)
 
-    plot_triangle_axes()
-    plot_triangle_grid()
-    # plot_simple_classes()
-    plot_usda_classes()
-    soil_plotter(dummy_textures, dummy_sizes, dummy_color_scalars)
-    plt.savefig(figure_name)
+    fig = new_figure()
+    ax = fig.add_subplot(111)
+    plot_triangle_axes(ax=ax)
+    plot_triangle_grid(ax=ax)
+    # plot_simple_classes(ax=ax)
+    plot_usda_classes(ax=ax)
+    soil_plotter(dummy_textures, dummy_sizes, dummy_color_scalars, ax=ax)
+    fig.savefig(figure_name)
 
 
@@ -0,0 +1,140 @@
+#!/bin/python
+
+""" Persistent SQLite store of soil data from many landscapes or scenarios.  Rows of soil data are appended to the store
+under a scenario name, keyed on soil texture quantized to 1% resolution, and a summary table holding the total area
+and color sums of each unique soil in each scenario is kept up to date as rows are added.  Both tables are indexed on
+scenario and texture key, so a single scenario's soils are read back without scanning or re-aggregating the rest of
+the store, e.g.
+
+    store = soil_store.SoilStore('soils.db')
+    store.replace('landscape_iii', sand, silt, clay, size, color, source_fpath='landscape_iii.csv', unless_current=True)
+    soils = store.soils('landscape_iii')
+"""
+
+
+from contextlib import contextmanager
+import numpy as np
+import os
+from soil_collection import SoilCollection, texture_keys
+import sqlite3
+import time
+
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS scenarios (scenario TEXT PRIMARY KEY, source_fpath TEXT, source_mtime REAL, "
+    "source_size INTEGER, rows INTEGER, updated TEXT)",
+    "CREATE TABLE IF NOT EXISTS soils (scenario TEXT, texture_key INTEGER, area REAL, color REAL)",
+    "CREATE INDEX IF NOT EXISTS soils_scenario_texture ON soils (scenario, texture_key)",
+    "CREATE TABLE IF NOT EXISTS soil_summary (scenario TEXT, texture_key INTEGER, area REAL, weighted_color REAL, "
+    "row_count INTEGER, color_sum REAL, PRIMARY KEY (scenario, texture_key)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS soil_summary_area ON soil_summary (scenario, area)",
+]
+
+
+def scenario_name(landscape_fpath, columns):
+    """ Return the default scenario name for the selected data columns of a landscape data file
+    """
+    return '%s:%s' % (os.path.abspath(landscape_fpath), ','.join(columns))
+
+
+class SoilStore(object):
+    """ Persistent, indexed store of soil data keyed by scenario, in a new or existing SQLite database file
+    """
+    def __init__(self, db_fpath='soils.db'):
+        self.db_fpath = db_fpath
+        # allow batch worker processes sharing the store to wait for each other's writes, and begin transactions
+        # explicitly (see _transaction())
+        self.con = sqlite3.connect(db_fpath, timeout=60, isolation_level=None)
+        with self._transaction():
+            for command in SCHEMA:
+                self.con.execute(command)
+
+    def close(self):
+        self.con.close()
+
+    @contextmanager
+    def _transaction(self):
+        """ Run a block of statements as a single transaction that holds the database's write lock from the start, so
+        that anything the block checks still holds when it writes, even with other processes sharing the store
+        """
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        self.con.execute("COMMIT")
+
+    def scenarios(self):
+        """ Return a list of the scenario names in the store
+        """
+        return [row[0] for row in self.con.execute("SELECT scenario FROM scenarios ORDER BY scenario")]
+
+    def is_current(self, scenario, source_fpath):
+        """ Check whether a scenario is in the store and was loaded from the current version of a source file
+        """
+        row = self.con.execute("SELECT source_mtime, source_size FROM scenarios WHERE scenario = ?",
+                               (scenario,)).fetchone()
+        if row is None or not os.path.exists(source_fpath):
+            return False
+        stat = os.stat(source_fpath)
+        return row[0] == stat.st_mtime and row[1] == stat.st_size
+
+    def append(self, scenario, sand, silt, clay, size, color, source_fpath=None):
+        """ Append arrays of soil data (sand, silt and clay content in percent, plus size and color values) to a new or
+        existing scenario, and bring the scenario's summary up to date.  Returns the number of rows appended
+        """
+        with self._transaction():
+            return self._append(scenario, sand, silt, clay, size, color, source_fpath)
+
+    def _append(self, scenario, sand, silt, clay, size, color, source_fpath=None):
+        keys = texture_keys(sand, silt, clay)
+        rows = zip([scenario] * len(keys), keys.tolist(), np.asarray(size, dtype=float).tolist(),
+                   np.asarray(color, dtype=float).tolist())
+        if source_fpath:
+            stat = os.stat(source_fpath)
+            source = (os.path.abspath(source_fpath), stat.st_mtime, stat.st_size)
+        else:
+            source = (None, None, None)
+
+        self.con.executemany("INSERT INTO soils VALUES (?, ?, ?, ?)", rows)
+
+        # re-total only this scenario's soils, reading them in texture key order from the index
+        self.con.execute("DELETE FROM soil_summary WHERE scenario = ?", (scenario,))
+        self.con.execute("INSERT INTO soil_summary SELECT scenario, texture_key, SUM(area), SUM(area*color), "
+                         "COUNT(*), SUM(color) FROM soils WHERE scenario = ? GROUP BY texture_key", (scenario,))
+
+        total = self.con.execute("SELECT SUM(row_count) FROM soil_summary WHERE scenario = ?",
+                                 (scenario,)).fetchone()[0]
+        self.con.execute("INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?, ?, ?, ?)",
+                         (scenario,) + source + (total, time.strftime('%Y-%m-%dT%H:%M:%S')))
+        return len(rows)
+
+    def remove(self, scenario):
+        """ Delete a scenario and all of its soil data from the store
+        """
+        with self._transaction():
+            self._remove(scenario)
+
+    def _remove(self, scenario):
+        for table in ('soils', 'soil_summary', 'scenarios'):
+            self.con.execute("DELETE FROM %s WHERE scenario = ?" % table, (scenario,))
+
+    def replace(self, scenario, sand, silt, clay, size, color, source_fpath=None, unless_current=False):
+        """ Replace all of a scenario's soil data with new arrays of soil data, as for append(), in one transaction.
+        With unless_current=True nothing is written if the scenario already holds the current version of source_fpath,
+        e.g. because another process sharing the store loaded it first.  Returns the number of rows written
+        """
+        with self._transaction():
+            if unless_current and source_fpath and self.is_current(scenario, source_fpath):
+                return 0
+            self._remove(scenario)
+            return self._append(scenario, sand, silt, clay, size, color, source_fpath)
+
+    def soils(self, scenario):
+        """ Return a SoilCollection of each unique soil in a scenario, with its total size and area-weighted mean color
+        value (see SoilCollection.from_totals()), sorted by size (largest first)
+        """
+        rows = self.con.execute("SELECT texture_key, area, weighted_color, color_sum, row_count FROM soil_summary "
+                                "WHERE scenario = ?", (scenario,)).fetchall()
+        return SoilCollection.from_totals(*(zip(*rows) if rows else ((),) * 5))